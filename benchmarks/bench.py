@@ -0,0 +1,420 @@
+"""
+Benchmarks for Row/Table materialization, caching and query building.
+
+Runs without a database by default, against a synthetic cursor that serves
+generated rows. Results are written as JSON so runs can be compared:
+
+    python -m benchmarks.bench --output before.json
+    python -m benchmarks.bench --compare before.json
+
+Pass --postgres with connection details to time the same reads against a
+scratch table in a real database.
+"""
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from unittest import mock
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from sedezcompendium.common import SQLManagement, SQLObjects
+from sedezcompendium.common.SQLCache import LRUCache
+
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+COLUMNS = ("id", "name", "score", "active")
+
+
+class BenchRow(SQLObjects.Row):
+    TABLE_NAME = "sedez_bench"
+    __columns__ = COLUMNS
+
+
+class BenchTable(SQLObjects.Table):
+    ROW_TYPE = BenchRow
+
+
+class BenchColumns(SQLObjects.ColumnTable):
+    ROW_TYPE = BenchRow
+
+
+def synthetic_rows(size):
+    """
+    :return: a list of size result tuples for BenchRow
+    """
+    return [(i, f"user{i}", i * 0.5, i % 2 == 0) for i in range(size)]
+
+
+class SyntheticCursor:
+    """
+    A stand-in cursor, in the spirit of EmptyCursor, that serves the rows of its
+    connection for every statement.
+    """
+
+    name = None
+
+    def __init__(self, conn):
+        self.connection = conn
+        self.rowcount = -1
+        self._result = []
+
+    def execute(self, statement, args = None):
+        self._result = self.connection.rows
+        self.rowcount = len(self._result)
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchmany(self, size = None):
+        return self._result[:size]
+
+    def fetchall(self):
+        return list(self._result)
+
+    @property
+    def description(self):
+        return tuple((column, None, None, None, None, None, None) for column in COLUMNS)
+
+    def close(self):
+        pass
+
+
+class SyntheticConnection:
+    closed = 0
+    autocommit = True
+
+    def __init__(self, *args, **kwargs):
+        self.rows = []
+
+    def set_session(self, autocommit = None):
+        pass
+
+    def cursor(self, name = None, withhold = False):
+        return SyntheticCursor(self)
+
+    def poll(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+def synthetic_database(**kwargs):
+    """
+    :return: a GenericDatabase connected to a SyntheticConnection
+    """
+    with mock.patch("psycopg2.connect", SyntheticConnection):
+        return SQLManagement.GenericDatabase("bench", "localhost", 5432, "bench", "bench", "public",
+                                             gen_cursor = True, **kwargs)
+
+
+def measure(func, repeat):
+    """
+    :param func: callable running the benchmark once, returning the number of operations
+    :param repeat: times to run it
+    :return: (best seconds, operations)
+    """
+    best = None
+    ops = 0
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        ops = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, ops
+
+
+def synthetic_benchmarks(size, lookups):
+    """
+    :return: a dict of benchmark name to callable, for a size
+    """
+    values = synthetic_rows(size)
+    rows = [BenchRow(*value) for value in values]
+    table = BenchTable(*rows)
+    probes = rows[-1:] * lookups
+    description = SyntheticCursor(None).description
+    kwargs = {"name": "sedez", "score": 1.5, "active": None}
+    db = synthetic_database()
+    db._conn.rows = values[:1]
+    # every lookup uses a new key, so a single entry cache always misses
+    uncached = synthetic_database(cache_backend = LRUCache(max_entries = 1))
+    uncached._conn.rows = values[:1]
+    listed = synthetic_database()
+    listed._conn.rows = values
+    columns = BenchColumns.from_records(values)
+    indexed = BenchTable(*rows)
+    indexed.create_index("id", unique = True)
+    snapshot = os.path.join(tempfile.mkdtemp(), "bench.snapshot")
+    table.dump(snapshot)
+
+    def row_init():
+        for value in values:
+            BenchRow(*value)
+        return size
+
+    def nrow_init():
+        for value in values:
+            SQLObjects.nRow(*value, columns = COLUMNS)
+        return size
+
+    def table_init():
+        BenchTable(*rows)
+        return size
+
+    def table_contains():
+        for probe in probes:
+            probe in table
+        return len(probes)
+
+    def gen_row():
+        for value in values:
+            db.gen_row(BenchRow, value, description)
+        return size
+
+    def gen_nrow():
+        for value in values:
+            db.gen_row(SQLObjects.nRow, value, description)
+        return size
+
+    def and_convert():
+        for _ in range(size):
+            db.and_convert(kwargs)
+        return size
+
+    def storage_key():
+        for i in range(size):
+            SQLManagement.storage_key({"id": i, "name": "sedez"})
+        return size
+
+    def get_item_uncached():
+        for i in range(size):
+            uncached.get_item(BenchRow, id = i)
+        return size
+
+    def get_item_cached():
+        db.get_item(BenchRow, id = 0)
+        for _ in range(size):
+            db.get_item(BenchRow, id = 0)
+        return size
+
+    def get_items():
+        listed.clear_cache()
+        listed.get_items(BenchTable)
+        return size
+
+    def load_table():
+        listed.load_table(BenchTable)
+        return size
+
+    def table_contains_indexed():
+        for probe in probes:
+            probe in indexed
+        return len(probes)
+
+    def table_lookup():
+        for i in range(size):
+            indexed.lookup("id", i)
+        return size
+
+    def snapshot_dump():
+        table.dump(snapshot)
+        return size
+
+    def snapshot_load():
+        BenchTable.load(snapshot)
+        return size
+
+    def snapshot_iterate():
+        for _ in BenchTable.load(snapshot):
+            pass
+        return size
+
+    def column_table_init():
+        BenchColumns.from_records(values)
+        return size
+
+    def table_filter_sum():
+        sum(row.score for row in table if row.active and row.score > 10)
+        return size
+
+    def column_table_filter_sum():
+        columns.sum("score", columns.mask("score", ">", 10), active = True)
+        return size
+
+    return {
+        "row_init": row_init,
+        "nrow_init": nrow_init,
+        "table_init": table_init,
+        "table_contains": table_contains,
+        "table_contains_indexed": table_contains_indexed,
+        "table_lookup": table_lookup,
+        "snapshot_dump": snapshot_dump,
+        "snapshot_load": snapshot_load,
+        "snapshot_iterate": snapshot_iterate,
+        "column_table_init": column_table_init,
+        "table_filter_sum": table_filter_sum,
+        "column_table_filter_sum": column_table_filter_sum,
+        "gen_row": gen_row,
+        "gen_nrow": gen_nrow,
+        "and_convert": and_convert,
+        "storage_key": storage_key,
+        "get_item_uncached": get_item_uncached,
+        "get_item_cached": get_item_cached,
+        "get_items": get_items,
+        "load_table": load_table,
+    }
+
+
+def postgres_benchmarks(size, options):
+    """
+    Loads size rows into a scratch table and times reads against it.
+    :return: a dict of benchmark name to callable, and a cleanup callable
+    """
+    db = SQLManagement.GenericDatabase(options.database, options.host, options.port, options.user,
+                                       options.password, options.schema, gen_cursor = True)
+    db.execute(f"DROP TABLE IF EXISTS {options.schema}.{BenchRow.TABLE_NAME};")
+    db.execute(f"CREATE TABLE {options.schema}.{BenchRow.TABLE_NAME} "
+               f"(id integer PRIMARY KEY, name text, score double precision, active boolean);")
+    db.insert_items((BenchRow(*value) for value in synthetic_rows(size)), batch_size = 10000, method = "copy")
+    lookups = min(size, 1000)
+
+    def get_item_uncached():
+        db.clear_cache()
+        for i in range(lookups):
+            db.get_item(BenchRow, id = i)
+        return lookups
+
+    def get_item_cached():
+        for _ in range(lookups):
+            db.get_item(BenchRow, id = 0)
+        return lookups
+
+    def get_many():
+        db.clear_cache()
+        db.get_many(BenchRow, "id", range(lookups))
+        return lookups
+
+    def load_table():
+        db.load_table(BenchTable)
+        return size
+
+    def iter_table():
+        for _ in db.iter_table(BenchTable, batch_size = 10000):
+            pass
+        return size
+
+    def cleanup():
+        db.execute(f"DROP TABLE IF EXISTS {options.schema}.{BenchRow.TABLE_NAME};")
+
+    return {
+        "pg_get_item_uncached": get_item_uncached,
+        "pg_get_item_cached": get_item_cached,
+        "pg_get_many": get_many,
+        "pg_load_table": load_table,
+        "pg_iter_table": iter_table,
+    }, cleanup
+
+
+def run(sizes, repeat = 3, lookups = 5, only = None, options = None):
+    """
+    Runs the benchmarks at every size.
+    :param only: substring benchmark names must contain to run. Defaults to all.
+    :param options: parsed command line options. With options.postgres set, the
+    Postgres benchmarks run too.
+    :return: the report, as a JSON-serializable dict
+    """
+    results = []
+    for size in sizes:
+        suites = [(synthetic_benchmarks(size, lookups), None)]
+        if options is not None and options.postgres:
+            suites.append(postgres_benchmarks(size, options))
+
+        for benchmarks, cleanup in suites:
+            try:
+                for name, func in benchmarks.items():
+                    if only is not None and only not in name:
+                        continue
+                    seconds, ops = measure(func, repeat)
+                    results.append({
+                        "name": name,
+                        "size": size,
+                        "ops": ops,
+                        "seconds": seconds,
+                        "ns_per_op": seconds / ops * 1e9 if ops else None,
+                    })
+                    print(f"{name:>22} {size:>8} {seconds:10.4f}s", file = sys.stderr)
+            finally:
+                if cleanup is not None:
+                    cleanup()
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    :return: the results of report more than threshold times slower than in baseline,
+    as (name, size, ratio) tuples
+    """
+    before = {(result["name"], result["size"]): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = before.get((result["name"], result["size"]))
+        if old is None or not old["seconds"]:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        if ratio > threshold:
+            regressions.append((result["name"], result["size"], ratio))
+    return regressions
+
+
+def main(argv = None):
+    parser = ArgumentParser(description = "Benchmarks for SedezCompendium.")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = DEFAULT_SIZES)
+    parser.add_argument("--repeat", type = int, default = 3, help = "runs per benchmark; the best is kept")
+    parser.add_argument("--lookups", type = int, default = 5, help = "probes per table_contains run")
+    parser.add_argument("--only", help = "only run benchmarks whose name contains this")
+    parser.add_argument("--output", help = "file to write the JSON report to. Defaults to stdout")
+    parser.add_argument("--compare", help = "JSON report to compare against")
+    parser.add_argument("--threshold", type = float, default = 1.25,
+                        help = "slowdown ratio reported as a regression by --compare")
+    parser.add_argument("--postgres", action = "store_true", help = "also benchmark against a database")
+    parser.add_argument("--host", default = "localhost")
+    parser.add_argument("--port", type = int, default = 5432)
+    parser.add_argument("--user", default = "postgres")
+    parser.add_argument("--password", default = "")
+    parser.add_argument("--database", default = "postgres")
+    parser.add_argument("--schema", default = "public")
+    options = parser.parse_args(argv)
+
+    report = run(options.sizes, options.repeat, options.lookups, options.only, options)
+    out = json.dumps(report, indent = 2)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(out)
+    else:
+        print(out)
+
+    if options.compare:
+        with open(options.compare) as file:
+            regressions = compare(report, json.load(file), options.threshold)
+        for name, size, ratio in regressions:
+            print(f"REGRESSION: {name} at {size} rows is {ratio:.2f}x slower", file = sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
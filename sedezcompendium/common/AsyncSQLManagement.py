@@ -0,0 +1,153 @@
+from .SQLCache import CACHE_NOT_FOUND
+from .SQLManagement import GenericDatabase, _cache_type, storage_key
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+
+
+_DONE = object()
+
+# context managers whose state lives on the thread that entered them
+_THREAD_BOUND = ("connection", "cursor", "server_cursor", "transaction", "batch")
+
+
+class AsyncGenericDatabase:
+    """
+    Asyncio facade for a GenericDatabase, for use inside discord.py event loops.
+    Queries run on a bounded executor so heartbeats and other commands keep
+    flowing while they're in flight. Row/Table materialization and the cache
+    are shared with the wrapped database.
+    """
+
+    def __init__(self, database, max_workers = None):
+        """
+        :param database: the GenericDatabase to run queries on.
+        :param max_workers: most queries in flight at once. Defaults to the pool's
+        max_connections. A single connection runs one query at a time, so an unpooled
+        database always gets 1.
+        """
+        stats = database.pool_stats()
+        if stats is None:
+            max_workers = 1
+        elif max_workers is None:
+            max_workers = stats["max_connections"]
+
+        self._db = database
+        self._pooled = stats is not None
+        self._executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = "GenericDatabase")
+        self._inflight = {}
+
+    @classmethod
+    async def connect(cls, *args, max_workers = None, **kwargs):
+        """
+        Creates the GenericDatabase off of the event loop, as connecting blocks.
+        :param args: arguments passed through to GenericDatabase.
+        :param max_workers: see __init__.
+        :param kwargs: keyword arguments passed through to GenericDatabase.
+        :return: an AsyncGenericDatabase
+        """
+        loop = asyncio.get_running_loop()
+        database = await loop.run_in_executor(None, partial(GenericDatabase, *args, **kwargs))
+        return cls(database, max_workers)
+
+    @property
+    def database(self):
+        return self._db
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs a blocking callable on the executor.
+        :param func: the callable to run
+        :return: the result of the callable
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def _coalesce(self, name, t_type, default, kwargs):
+        # identical reads already in flight are awaited rather than given an executor
+        # worker of their own, which would only block waiting on the same query
+        r_type = _cache_type(t_type)
+        key = (name, r_type, storage_key(kwargs), self._db._generation(r_type))
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.run(getattr(self._db, name), t_type, CACHE_NOT_FOUND, **kwargs))
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._inflight.pop(key, None))
+        res = await asyncio.shield(future)
+        return default if res is CACHE_NOT_FOUND else res
+
+    async def get_item(self, t_type, default = None, **kwargs):
+        return await self._coalesce("get_item", t_type, default, kwargs)
+
+    async def get_items(self, t_type, default = None, **kwargs):
+        return await self._coalesce("get_items", t_type, default, kwargs)
+
+    async def load_table(self, t_type):
+        return await self.run(self._db.load_table, t_type)
+
+    async def insert_item(self, data):
+        return await self.run(self._db.insert_item, data)
+
+    async def update_item(self, data, **kwargs):
+        return await self.run(self._db.update_item, data, **kwargs)
+
+    async def remove_rows(self, t_type, limit = None, **kwargs):
+        return await self.run(self._db.remove_rows, t_type, limit, **kwargs)
+
+    async def iter_items(self, t_type, batch_size = 1000, **kwargs):
+        """
+        Asynchronously iterates over the items matching the filters. See GenericDatabase.iter_items.
+        """
+        async for chunk in self._iterate(self._db._iter_chunks, t_type, batch_size, kwargs):
+            for row in chunk:
+                yield row
+
+    async def iter_table(self, t_type, batch_size = 1000):
+        """
+        Asynchronously iterates over a table in chunks. See GenericDatabase.iter_table.
+        """
+        async for chunk in self._iterate(self._db.iter_table, t_type, batch_size):
+            yield chunk
+
+    async def _iterate(self, func, *args):
+        # the generator holds its connection (and on a shared connection, the lock) between
+        # batches, so every step has to run on the same thread. A shared connection steps it
+        # on the executor's only thread, so that queries awaited between steps re-enter the lock
+        loop = asyncio.get_running_loop()
+        if self._pooled:
+            executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "GenericDatabase")
+        else:
+            executor = self._executor
+        generator = await loop.run_in_executor(executor, partial(func, *args))
+        try:
+            while True:
+                item = await loop.run_in_executor(executor, next, generator, _DONE)
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            await loop.run_in_executor(executor, generator.close)
+            if executor is not self._executor:
+                executor.shutdown(wait = False)
+
+    def __getattr__(self, name):
+        # any other GenericDatabase method is exposed as a coroutine function
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in _THREAD_BOUND:
+            raise AttributeError(f"{name} holds thread-local state and can't be awaited. "
+                                 f"Pass a function using database.{name}() to run() instead.")
+        attr = getattr(self._db, name)
+        if not callable(attr):
+            return attr
+
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        return method
+
+    async def close(self):
+        """
+        Waits for queries in flight and shuts the executor down.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, partial(self._executor.shutdown, wait = True))
@@ -0,0 +1,202 @@
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+
+CACHE_MISS = object()
+CACHE_NOT_FOUND = object()
+
+
+def sizeof(value):
+    """
+    Roughly estimates the memory held by a cached value, including the column
+    values of Rows and the rows of Tables and lists.
+    :param value: the cached value
+    :return: size in bytes
+    """
+    size = sys.getsizeof(value)
+    columns = getattr(value, "__columns__", None)
+    if isinstance(value, (list, tuple)) or hasattr(value, "__rows__"):
+        for row in value:
+            size += sizeof(row)
+    elif columns:
+        for column in columns:
+            size += sys.getsizeof(getattr(value, column, None))
+    return size
+
+
+class CacheBackend(metaclass = ABCMeta):
+    """
+    Storage for the results of @cache decorated GenericDatabase methods. Entries are
+    grouped by table, which is the row type the result was loaded for.
+    """
+
+    @abstractmethod
+    def get(self, table, key):
+        """
+        :return: the cached value, or CACHE_MISS.
+        """
+
+    @abstractmethod
+    def set(self, table, key, value, ttl = None, negative = False):
+        """
+        :param ttl: seconds until the entry expires. Defaults to the backend's ttl.
+        :param negative: whether the value records that nothing was found.
+        """
+
+    @abstractmethod
+    def invalidate(self, table, match = None):
+        """
+        Removes entries for a table.
+        :param match: predicate on the entry key. Defaults to removing every entry.
+        :return: the number of entries removed
+        """
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    @abstractmethod
+    def tables(self):
+        """
+        :return: the tables that currently have entries.
+        """
+
+    @abstractmethod
+    def stats(self):
+        pass
+
+
+class LRUCache(CacheBackend):
+    """
+    A thread-safe cache backend with per-table LRU eviction and optional expiry.
+    With no limits set it keeps every entry until it is invalidated.
+    """
+
+    def __init__(self, max_entries = None, max_bytes = None, ttl = None, negative_ttl = 60, table_limits = None):
+        """
+        :param max_entries: most entries kept per table.
+        :param max_bytes: most bytes kept per table, as estimated by sizeof.
+        :param ttl: seconds an entry lives for. Defaults to forever.
+        :param negative_ttl: seconds a negative entry lives for, capped by ttl. 
+        None keeps them as long as ttl, 0 disables negative caching.
+        :param table_limits: overrides per table, mapping a row type or table name
+        to a dict of max_entries, max_bytes, ttl and/or negative_ttl.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.table_limits = table_limits or {}
+        self._tables = {}
+        self._bytes = {}
+        self._lock = threading.RLock()
+        self._stats = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def _limit(self, table, name):
+        limits = self.table_limits.get(table)
+        if limits is None and hasattr(table, "table_name"):
+            limits = self.table_limits.get(table.table_name())
+        if limits is not None and name in limits:
+            return limits[name]
+        return getattr(self, name)
+
+    def _remove(self, table, key):
+        value, expires, size, negative = self._tables[table].pop(key)
+        self._bytes[table] -= size
+
+    def get(self, table, key):
+        with self._lock:
+            entries = self._tables.get(table)
+            entry = None if entries is None else entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return CACHE_MISS
+
+            if entry[1] is not None and entry[1] <= time.monotonic():
+                self._remove(table, key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return CACHE_MISS
+
+            entries.move_to_end(key)
+            self._stats["hits"] += 1
+            if entry[3]:
+                self._stats["negative_hits"] += 1
+            return entry[0]
+
+    def set(self, table, key, value, ttl = None, negative = False):
+        if ttl is None:
+            ttl = self._limit(table, "ttl")
+        if negative:
+            negative_ttl = self._limit(table, "negative_ttl")
+            if negative_ttl == 0:
+                return
+            if ttl is None or (negative_ttl is not None and negative_ttl < ttl):
+                ttl = negative_ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        max_entries = self._limit(table, "max_entries")
+        max_bytes = self._limit(table, "max_bytes")
+        size = 0 if max_bytes is None else sizeof(value)
+
+        with self._lock:
+            entries = self._tables.setdefault(table, OrderedDict())
+            self._bytes.setdefault(table, 0)
+            if key in entries:
+                self._remove(table, key)
+            if max_bytes is not None and size > max_bytes:
+                return
+
+            entries[key] = (value, expires, size, negative)
+            self._bytes[table] += size
+            while (max_entries is not None and len(entries) > max_entries) or \
+                    (max_bytes is not None and self._bytes[table] > max_bytes):
+                self._remove(table, next(iter(entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, table, match = None):
+        with self._lock:
+            entries = self._tables.get(table)
+            if not entries:
+                return 0
+
+            if match is None:
+                removed = len(entries)
+                entries.clear()
+                self._bytes[table] = 0
+            else:
+                keys = [key for key in entries if match(key)]
+                for key in keys:
+                    self._remove(table, key)
+                removed = len(keys)
+            self._stats["invalidations"] += removed
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+            self._bytes.clear()
+
+    def tables(self):
+        with self._lock:
+            return [table for table, entries in self._tables.items() if entries]
+
+    def stats(self):
+        """
+        :return: a dict of hit, negative hit, miss, eviction, expiration and invalidation counters,
+        plus the entries and estimated bytes held per table.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["tables"] = {table: {"entries": len(entries), "bytes": self._bytes[table]}
+                               for table, entries in self._tables.items()}
+            return stats
@@ -1,5 +1,29 @@
-from .SQLObjects import Row, Table, nRow
+from .SQLObjects import Row, Table, ColumnTable, nRow, row_factory
+from .SQLPool import ConnectionPool
+from .SQLCache import CACHE_MISS, CACHE_NOT_FOUND, LRUCache
+from .SQLMetrics import result_bytes
+from .SQLNotify import NotifyListener
+from . import SQLSnapshot
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from functools import wraps
+from inspect import signature
+from io import StringIO
+from itertools import islice
+from uuid import UUID, uuid4
+from weakref import WeakKeyDictionary
+import base64
+import hashlib
+import json
+import logging
+import threading
+import time
 import psycopg2
+import psycopg2.extras
+
+
+logger = logging.getLogger(__name__)
 
 
 class EmptyCursor(psycopg2.extensions.cursor):
@@ -49,78 +73,560 @@ def storage_key(kwargs):
     """
     Generate the storage key for the cache. 
     :param kwargs: Keyword arguments dict 
-    :return: AND statement
+    :return: frozenset of the keyword argument items
+    """
+    return frozenset(kwargs.items())
+
+
+def _cache_type(t_type): 
+    """
+    :return: the row type results for t_type are cached under
+    """
+    if not isinstance(t_type, type): 
+        t_type = type(t_type)
+    try: 
+        return t_type.row_type()
+    except: 
+        return t_type
+
+
+def _cache_key(name, kwargs): 
+    """
+    :param name: name of the cached function
+    :param kwargs: Keyword arguments dict
+    :return: the key of the cache entry for a call
+    """
+    return (name, storage_key(kwargs))
+
+
+def _table_of(data): 
+    """
+    :param data: a type, table name, Row, Table or list of Rows
+    :return: the name of the table, or None
     """
-    return frozenset(f"{hash(i)}|{hash(kwargs[i])}" for i in kwargs)
+    if isinstance(data, str): 
+        return data
+    if isinstance(data, (list, tuple)): 
+        data = data[0] if data else None
+    try: 
+        return data.table_name()
+    except: 
+        return None
+
+
+def _row_count(result): 
+    """
+    :return: the number of rows in the result of a database operation, or None if unknown
+    """
+    if result is None or isinstance(result, bool): 
+        return None
+    if isinstance(result, int): 
+        return result
+    if isinstance(result, Row): 
+        return 1
+    try: 
+        return len(result)
+    except TypeError: 
+        return None
 
 
-_cache_dict = {}
+# writes touching more rows than this flush the whole type rather than matching each entry
+_SCOPE_LIMIT = 1000
+
+
+def _row_values(data): 
+    """
+    :param data: a Row, or a Table or iterable of Rows
+    :return: a list of {column: value} dicts, one per row
+    """
+    if isinstance(data, Row): 
+        data = [data]
+    return [{column: getattr(row, column) for column in row.__columns__} for row in data]
+
+
+def _affects(scope): 
+    """
+    Builds a predicate for which cache entries a write could affect. 
+    :param scope: list of {column: value} dicts, each describing what is known 
+    about a row the write touches, before or after the write.
+    :return: predicate on cache keys
+    """
+    def match(key): 
+        filters = key[1]
+        for row in scope: 
+            for column, value in filters: 
+                if column in row and row[column] != value: 
+                    break
+            else: 
+                return True
+        return False
+
+    return match
+
+
+def _insert_scope(self, data, *args, **kwargs): 
+    if not isinstance(data, Row) and len(data) > _SCOPE_LIMIT: 
+        return None
+    return _row_values(data)
+
+
+def _remove_scope(self, t_type, limit = None, **kwargs): 
+    if not kwargs: 
+        return None
+    return [kwargs]
+
+
+def _keys_scope(self, data, key_columns = ("id",), *args, **kwargs): 
+    if isinstance(data, Row): 
+        data = [data]
+    if len(data) > _SCOPE_LIMIT: 
+        return None
+    key_columns = (key_columns,) if isinstance(key_columns, str) else tuple(key_columns)
+    # only the keys are known from before the write, and they don't change
+    return [{column: getattr(row, column) for column in key_columns} for row in data]
+
+
+def _keys_refresh(self, result, data, key_columns = ("id",), *args, **kwargs): 
+    if isinstance(result, Row): 
+        result = [result]
+    key_columns = (key_columns,) if isinstance(key_columns, str) else tuple(key_columns)
+    for row in result: 
+        key = {column: getattr(row, column) for column in key_columns}
+        self._cache.set(_cache_type(type(row)), _cache_key("get_item", key), row)
+
+
+def _update_scope(self, data, **kwargs): 
+    if not kwargs: 
+        return None
+    # rows matched the filters before the write and hold the new values after it
+    return [kwargs] + [dict(kwargs, **values) for values in _row_values(data)]
 
 
 def cache(func): 
     """
-    Creates an entry in the cache if one does not already exist, 
+    Creates an entry in the database's cache backend if one does not already exist, 
     so that information that is not from the database can be stored and retrieved. 
+    Misses (None, or an empty result) are cached too, as negative entries. 
     :param func: function to be converted into the cache 
     :return: new function 
     """
-
-    _cache_dict[func] = {}
+    takes_default = "default" in signature(func).parameters
 
     def check_cache(self, t_type, *args, **kwargs):
-        o_type = t_type
- 
-        try: 
-            t_type = t_type.row_type()
-        except: 
-            pass
+        # the default isn't part of the cache key, so it is swapped for the sentinel
+        if takes_default: 
+            default = kwargs.pop("default", args[0] if args else None)
+            args = args[1:]
+            kwargs_default = {"default": CACHE_NOT_FOUND}
+        else: 
+            default = None
+            kwargs_default = {}
+
+        # reads inside a transaction may see uncommitted writes, so they aren't cached
+        if self.in_transaction(): 
+            res = func(self, t_type, *args, **kwargs_default, **kwargs)
+            return default if res is None or res is CACHE_NOT_FOUND else res
+
+        r_type = _cache_type(t_type)
+        cache_key = _cache_key(func.__name__, kwargs)
+        res = self._cache.get(r_type, cache_key)
+        if self._metrics is not None: 
+            self._metrics.cache(func.__name__, _table_of(t_type), res is not CACHE_MISS)
+        if res is CACHE_NOT_FOUND: 
+            return default
+        if res is not CACHE_MISS:
+            return res
+
+        # concurrent misses for the same key share one query. A write bumps the 
+        # generation, so callers arriving after it don't join a query that started before
+        generation = self._generation(r_type)
+        if getattr(self._local, "holding", 0): 
+            res = _load(self, func, r_type, cache_key, generation, t_type, *args, **kwargs_default, **kwargs)
+            return default if res is CACHE_NOT_FOUND else res
+
+        flight_key = (r_type, cache_key, generation)
+        with self._flight_lock: 
+            flight = self._flights.get(flight_key)
+            leading = flight is None
+            if leading: 
+                flight = self._flights[flight_key] = _Flight()
 
-        _cache = _cache_dict[func].setdefault(t_type, {})
-        cache_key = storage_key(kwargs)
-        if _cache.get(cache_key, None) is not None:
-            return _cache[cache_key]
-        res = func(self, o_type, *args, **kwargs)
-        _cache[cache_key] = res
-        return res
+        if not leading: 
+            if not flight.done.wait(_FLIGHT_TIMEOUT) or flight.failed: 
+                res = _load(self, func, r_type, cache_key, generation, t_type, *args, **kwargs_default, **kwargs)
+            else: 
+                res = flight.result
+            return default if res is CACHE_NOT_FOUND else res
+
+        try: 
+            res = flight.result = _load(self, func, r_type, cache_key, generation, 
+                                        t_type, *args, **kwargs_default, **kwargs)
+        except BaseException: 
+            flight.failed = True
+            raise
+        finally: 
+            with self._flight_lock: 
+                del self._flights[flight_key]
+            flight.done.set()
+        return default if res is CACHE_NOT_FOUND else res
 
     return check_cache
 
 
-def invalidate(func): 
+# seconds a caller waits on another's query before running its own
+_FLIGHT_TIMEOUT = 30
+
+
+class _Flight: 
+    """
+    A cache miss being loaded, which other callers for the same key wait on.
+    """
+
+    __slots__ = ("done", "result", "failed")
+
+    def __init__(self): 
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+def _load(self, func, r_type, cache_key, generation, *args, **kwargs): 
+    """
+    Runs a cached function and stores its result, unless the table was written to 
+    while it ran, as the result may then be stale.
+    :return: the result, or CACHE_NOT_FOUND
+    """
+    res = func(self, *args, **kwargs)
+    if res is None: 
+        res = CACHE_NOT_FOUND
+    try: 
+        negative = res is CACHE_NOT_FOUND or len(res) == 0
+    except TypeError: 
+        negative = False
+    if self._generation(r_type) == generation: 
+        self._cache.set(r_type, cache_key, res, negative = negative)
+    return res
+
+
+def invalidate(func = None, scope = None, refresh = None): 
     """
-    Invalidates the cache if it is changed. 
+    Invalidates the cache once it is changed. Without a scope, every entry for the 
+    type is removed. 
     :param func: The function passed in to invalidate. 
+    :param scope: function taking the same arguments as func and returning the rows 
+    the write could affect as a list of {column: value} dicts, or None if unknown. 
+    Only cache entries whose filters could match one of those rows are removed.
+    :param refresh: function taking the database, the result of func and then the 
+    same arguments as func, which writes fresh entries back after invalidating.
     :return: new function
     """
+    if func is None: 
+        return lambda f: invalidate(f, scope, refresh)
+
     def invalidate_cache(self, *args, **kwargs):
-        if len(args) > 0: 
-            if not isinstance(args[0], type): 
-                t_type = type(args[0])
-            else:
-                t_type = args[0]
-            
-            try: 
-                t_type = t_type.row_type()
-            except:
-                pass
-    
-            for key in _cache_dict:
-                try:
-                    del _cache_dict[key][t_type]
-                except KeyError:
+        # one-shot iterables are materialized so that both the write and the scope see the rows
+        if len(args) > 0 and not isinstance(args[0], (type, str, Row, Table, list, tuple)) \
+                and hasattr(args[0], "__iter__"): 
+            args = (list(args[0]),) + args[1:]
+
+        result = None
+        try: 
+            result = func(self, *args, **kwargs)
+            return result
+        finally: 
+            if len(args) > 0: 
+                if isinstance(args[0], (type, str)): 
+                    t_type = args[0]
+                elif isinstance(args[0], (list, tuple)): 
+                    t_type = type(args[0][0]) if len(args[0]) else None
+                else:
+                    t_type = type(args[0])
+                
+                try: 
+                    t_type = t_type.row_type()
+                except:
                     pass
         
-        return func(self, *args, **kwargs)
+                if t_type is not None: 
+                    rows = None if scope is None else scope(self, *args, **kwargs)
+                    self._invalidate(t_type, rows)
+                    if refresh is not None and result is not None: 
+                        self._refresh(refresh, result, *args, **kwargs)
 
     return invalidate_cache
 
 
+class _Trace: 
+    """
+    Measurements of the database operation running on a thread.
+    """
+
+    __slots__ = ("statements", "rows", "fetched")
+
+    def __init__(self): 
+        self.statements = []
+        self.rows = 0
+        self.fetched = 0
+
+
+def instrument(func): 
+    """
+    Measures a database operation for the metrics hook and the slow query log. Cache 
+    hits don't reach it, so it goes below @cache and @invalidate. 
+    :param func: The function passed in to measure. 
+    :return: new function
+    """
+    @wraps(func)
+    def measure(self, *args, **kwargs): 
+        if self._metrics is None and self._slow_query is None: 
+            return func(self, *args, **kwargs)
+
+        outer = getattr(self._local, "trace", None)
+        trace = self._local.trace = _Trace()
+        result = None
+        start = time.perf_counter()
+        try: 
+            result = func(self, *args, **kwargs)
+            return result
+        finally: 
+            seconds = time.perf_counter() - start
+            self._local.trace = outer
+            self._measured(func.__name__, _table_of(args[0]) if args else None, seconds, result, trace)
+
+    return measure
+
+
+def _disconnected(error, conn = None): 
+    """
+    :return: whether an error means the connection to the database was lost, rather 
+    than that the statement failed
+    """
+    if conn is not None and getattr(conn, "closed", 0): 
+        return True
+    if isinstance(error, psycopg2.InterfaceError): 
+        return True
+    code = getattr(error, "pgcode", None)
+    if code is not None: 
+        # connection exceptions, and the server shutting down or being restarted
+        return code.startswith("08") or code in ("57P01", "57P02", "57P03")
+    # raised by libpq itself, such as when the server closes the connection
+    return isinstance(error, psycopg2.OperationalError)
+
+
+def retry(func): 
+    """
+    Reruns an idempotent read when the connection drops part way through, reconnecting 
+    with an exponential backoff, up to the database's read_retries times. Reads inside 
+    a transaction aren't retried, as the transaction is lost with the connection. 
+    :param func: The function passed in to retry. 
+    :return: new function
+    """
+    @wraps(func)
+    def retrying(self, *args, **kwargs): 
+        if not self._read_retries or self.in_transaction() or getattr(self._local, "retrying", False): 
+            return func(self, *args, **kwargs)
+
+        self._local.retrying = True
+        try: 
+            attempt = 0
+            while True: 
+                try: 
+                    return func(self, *args, **kwargs)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as e: 
+                    if attempt >= self._read_retries or not _disconnected(e): 
+                        raise
+                    logger.warning("RETRY %s: %s", func.__name__, e)
+                    self._connection_event("retry")
+                    if attempt: 
+                        time.sleep(min(self._retry_delay * 2 ** (attempt - 1), self._max_retry_delay))
+                    self._reconnect()
+                    attempt += 1
+        finally: 
+            self._local.retrying = False
+
+    return retrying
+
+
+def _batches(iterable, size): 
+    """
+    :return: successive lists of up to size items from the iterable
+    """
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch: 
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def _copy_value(value): 
+    """
+    Formats a value for COPY ... FROM STDIN in text format.
+    """
+    if value is None: 
+        return "\\N"
+    if isinstance(value, (bytes, bytearray, memoryview)): 
+        return "\\\\x" + bytes(value).hex()
+    if isinstance(value, dict): 
+        value = json.dumps(value)
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _filter_key(kwargs): 
+    """
+    :return: the (column, is_null) pairs a set of filters is templated on
+    """
+    return tuple((column, value is None) for column, value in kwargs.items())
+
+
+def _filter_values(kwargs): 
+    """
+    :return: the parameters for the filters, as NULL filters take none
+    """
+    return tuple(value for value in kwargs.values() if value is not None)
+
+
+def _json_value(value): 
+    """
+    Encodes the values JSON can't hold, for page tokens and invalidation notifications.
+    """
+    if isinstance(value, datetime): 
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date): 
+        return {"$date": value.isoformat()}
+    if isinstance(value, Decimal): 
+        return {"$decimal": str(value)}
+    if isinstance(value, UUID): 
+        return {"$uuid": str(value)}
+    raise TypeError(f"Can't page by a value of type {type(value).__name__}.")
+
+
+_JSON_TYPES = {
+    "$datetime": datetime.fromisoformat, 
+    "$date": date.fromisoformat, 
+    "$decimal": Decimal, 
+    "$uuid": UUID, 
+}
+
+
+def _json_object(obj): 
+    if len(obj) == 1: 
+        (tag, value), = obj.items()
+        if tag in _JSON_TYPES: 
+            return _JSON_TYPES[tag](value)
+    return obj
+
+
+def _page_token(values): 
+    """
+    :param values: the values of the order columns in the last row of a page
+    :return: an opaque, URL-safe token for the page after it
+    """
+    encoded = json.dumps(list(values), separators = (",", ":"), default = _json_value)
+    return base64.urlsafe_b64encode(encoded.encode()).rstrip(b"=").decode()
+
+
+def _page_values(token, count): 
+    """
+    :param token: a token made by _page_token
+    :param count: the number of order columns it should hold
+    :return: the values it holds
+    :raises ValueError: if it isn't a token for count columns
+    """
+    try: 
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)), 
+                            object_hook = _json_object)
+    except Exception as e: 
+        raise ValueError(f"Invalid page token {token!r}.") from e
+    if not isinstance(values, list) or len(values) != count: 
+        raise ValueError(f"Invalid page token {token!r}.")
+    return tuple(values)
+
+
+# NOTIFY payloads must be shorter than 8000 bytes
+_PAYLOAD_LIMIT = 7900
+
+
+def _notify_payload(origin, table, rows): 
+    """
+    :return: the JSON payload announcing an invalidation. When the rows can't be 
+    encoded, or would make it too long, it announces the whole table instead.
+    """
+    if rows is not None: 
+        try: 
+            payload = json.dumps({"origin": origin, "table": table, "rows": rows}, 
+                                 separators = (",", ":"), default = _json_value)
+            if len(payload.encode()) <= _PAYLOAD_LIMIT: 
+                return payload
+        except (TypeError, ValueError): 
+            pass
+    return json.dumps({"origin": origin, "table": table, "rows": None}, separators = (",", ":"))
+
+
+def _prepared_name(statement): 
+    """
+    :return: the name a statement is prepared under
+    """
+    return f"sedez_{hashlib.md5(statement.encode()).hexdigest()[:16]}"
+
+
+def _numbered(statement): 
+    """
+    Converts %s placeholders into the $1, $2, ... placeholders PREPARE expects.
+    """
+    parts = statement.split("%s")
+    out = parts[0]
+    for i in range(1, len(parts)): 
+        out += f"${i}{parts[i]}"
+    return out
+
+
+class _Transaction: 
+    """
+    State of an open transaction: its connection, the writes queued by a batch, and 
+    the cache updates to apply once it commits.
+    """
+
+    __slots__ = ("conn", "queue", "pending")
+
+    def __init__(self, conn, batch = False): 
+        self.conn = conn
+        self.queue = [] if batch else None
+        self.pending = []
+
+
 class GenericDatabase:
     """
     Generic database designed to work with Postgresql and psycopg2.
     """
 
-    def __init__(self, db_name, address, port, username, password, schema, gen_cursor = False): 
+    def __init__(self, db_name, address, port, username, password, schema, gen_cursor = False, 
+                 min_connections = 1, max_connections = None, pool_timeout = None, cache_backend = None, 
+                 prepare = False, metrics = None, slow_query = None, notify_channel = None, 
+                 read_retries = 3, retry_delay = 0.1, max_retry_delay = 2.0): 
+        """
+        :param gen_cursor: whether to connect to the database straight away.
+        :param min_connections: connections the pool opens up front. Only used in pooled mode.
+        Once opened, up to max_connections are kept open for reuse.
+        :param max_connections: enables pooled mode, with up to this many connections 
+        checked out at once. Defaults to None, sharing a single connection.
+        :param pool_timeout: seconds to wait for a pooled connection. Defaults to forever.
+        :param cache_backend: the CacheBackend for @cache results. Defaults to an 
+        unbounded LRUCache.
+        :param prepare: whether to PREPARE templated statements server-side, once per 
+        connection, so repeated queries skip parsing and planning. Defaults to False.
+        :param metrics: a MetricsHook, such as QueryMetrics, that is given the latency, rows 
+        and bytes of every operation, @cache hits and misses and invalidations. Defaults to None.
+        :param slow_query: seconds after which an operation is logged as a warning, with the 
+        timings of its statements. Defaults to None, logging nothing.
+        :param notify_channel: enables cache coherence between processes. Invalidations 
+        are published on this NOTIFY channel, and a background thread listens on it to 
+        evict what other processes wrote. Defaults to None, keeping the cache local.
+        :param read_retries: times a read is rerun after its connection drops, reconnecting 
+        first. Defaults to 3. 0 disables retrying.
+        :param retry_delay: seconds to wait before the second retry, doubled for each 
+        one after it. The first retry doesn't wait.
+        :param max_retry_delay: most seconds to wait before a retry.
+        """
         self.__host = address
         self.__port = port
         self.__username = username
@@ -128,27 +634,224 @@ class GenericDatabase:
         self._db_name = db_name
         self._schema = schema
         self._conn = None
+        self._pool = None
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._cache = LRUCache() if cache_backend is None else cache_backend
+        self._templates = {}
+        self._column_types = {}
+        self._prepare = prepare
+        self._prepared = WeakKeyDictionary()
+        self._metrics = metrics
+        self._slow_query = slow_query
+        self._notify_channel = notify_channel
+        self._origin = uuid4().hex
+        self._listener = None
+        self._flights = {}
+        self._flight_lock = threading.Lock()
+        self._generations = {}
+        self._cleared = 0
+        self._read_retries = read_retries
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        # a database that was asked to connect reconnects whenever it finds itself disconnected
+        self._reconnects = gen_cursor
+        self._pool_args = None if max_connections is None else (min_connections, max_connections, pool_timeout)
+        self._stats_lock = threading.Lock()
+        self._connection_stats = {
+            "disconnects": 0, 
+            "reconnects": 0, 
+            "reconnect_failures": 0, 
+            "retries": 0, 
+            "last_disconnect": None, 
+        }
+        self.__cursor = EmptyCursor()
         if gen_cursor:
-            self.__cursor = self.cursor_gen()
-        else: 
-            self.__cursor = EmptyCursor()
+            if max_connections is not None: 
+                self._pool = self.pool_gen(min_connections, max_connections, pool_timeout)
+            else: 
+                self.__cursor = self.cursor_gen()
+            if notify_channel is not None: 
+                self.listen(notify_channel)
 
     def and_convert(self, kwargs): 
         """
-        Generates an SQL statement of ANDed together parameters. 
-        :param kwargs: Keyword argument dict
+        Generates a parameterized SQL statement of ANDed together parameters. The values 
+        are passed separately, in order, skipping None values, which are matched with IS NULL. 
+        :param kwargs: Keyword argument dict, or (column, is_null) pairs
         :return: ANDed string
         """
+        if isinstance(kwargs, dict): 
+            kwargs = _filter_key(kwargs)
 
         if len(kwargs) > 0: 
             out = " WHERE"
         else: 
             out = ""
         
-        for key, value in kwargs.items(): 
-            out += f" {key} = {value} AND"
+        for key, is_null in kwargs: 
+            if is_null: 
+                out += f" {key} IS NULL AND"
+            else: 
+                out += f" {key} = %s AND"
         out = out[:-4]
         return out 
+
+    def template(self, operation, table, columns = (), filters = ()): 
+        """
+        Generates a parameterized statement, cached by its shape so it is only built once. 
+        :param operation: one of "select", "select_one", "select_any", "select_since", "count", 
+        "insert", "update", "update_from", "upsert", "delete", "delete_from", "delete_limit", 
+        or "page", "page_after", "page_desc" and "page_after_desc"
+        :param table: name of the table
+        :param columns: tuple of columns written by inserts and updates, or ordered by for pages
+        :param filters: tuple of (column, is_null) pairs to filter by. For "update_from", 
+        "upsert" and "delete_from", the key columns rows are matched on.
+        :return: the statement. Placeholders take the column values, then the filter 
+        values, then the limit and offset for "delete_limit". Pages take the filter values, 
+        the values of the last row of the previous page for "page_after", then the limit. 
+        "update_from", "upsert" and "delete_from" take a VALUES list, for execute_values.
+        """
+        key = (operation, table, columns, filters)
+        statement = self._templates.get(key)
+        if statement is not None: 
+            return statement
+
+        table = f"{self._schema}.{table}"
+        where = self.and_convert(filters)
+        if operation == "select": 
+            statement = f"SELECT * FROM {table}{where};"
+        elif operation == "select_any": 
+            statement = f"SELECT * FROM {table} WHERE {columns[0]} = ANY(%s);"
+        elif operation == "select_since": 
+            statement = f"SELECT * FROM {table} WHERE {columns[0]} >= %s;"
+        elif operation == "count": 
+            statement = f"SELECT count(*) FROM {table}{where};"
+        elif operation == "select_one": 
+            statement = f"SELECT * FROM {table}{where} LIMIT 1;"
+        elif operation == "insert": 
+            statement = f"INSERT INTO {table} ({','.join(columns)}) VALUES ({','.join(['%s'] * len(columns))});"
+        elif operation == "update": 
+            statement = f"UPDATE {table} SET {', '.join(f'{column} = %s' for column in columns)}{where};"
+        elif operation == "update_from": 
+            keys = [column for column, is_null in filters]
+            statement = (f"UPDATE {table} AS _t SET "
+                         f"{', '.join(f'{column} = _v.{column}' for column in columns if column not in keys)} "
+                         f"FROM (VALUES %s) AS _v ({', '.join(columns)}) "
+                         f"WHERE {' AND '.join(f'_t.{column} = _v.{column}' for column in keys)};")
+        elif operation == "upsert": 
+            keys = [column for column, is_null in filters]
+            updates = [f"{column} = EXCLUDED.{column}" for column in columns if column not in keys]
+            action = f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+            statement = (f"INSERT INTO {table} ({','.join(columns)}) VALUES %s "
+                         f"ON CONFLICT ({','.join(keys)}) {action} RETURNING {','.join(columns)};")
+        elif operation == "delete": 
+            statement = f"DELETE FROM {table}{where};"
+        elif operation == "delete_from": 
+            keys = [column for column, is_null in filters]
+            statement = (f"DELETE FROM {table} AS _t USING (VALUES %s) AS _v ({', '.join(keys)}) "
+                         f"WHERE {' AND '.join(f'_t.{column} = _v.{column}' for column in keys)};")
+        elif operation == "delete_limit": 
+            statement = f"DELETE FROM {table} WHERE ctid IN (SELECT ctid FROM {table}{where} LIMIT %s OFFSET %s);"
+        elif operation in ("page", "page_after", "page_desc", "page_after_desc"): 
+            descending = operation.endswith("_desc")
+            if operation.startswith("page_after"): 
+                # a row comparison, so an index on the columns can seek straight to the page
+                keyset = (f"({', '.join(columns)}) {'<' if descending else '>'} "
+                          f"({', '.join(['%s'] * len(columns))})")
+                where = f"{where} AND {keyset}" if where else f" WHERE {keyset}"
+            order = ", ".join(f"{column} DESC" if descending else column for column in columns)
+            statement = f"SELECT * FROM {table}{where} ORDER BY {order} LIMIT %s;"
+        else: 
+            raise ValueError(f"Unknown operation {operation}.")
+
+        self._templates[key] = statement
+        return statement
+
+    def _forget_table(self, table): 
+        """
+        Drops what is cached about a table's shape after DDL: its templates, its column 
+        types and its prepared statements, which are deallocated on next use. 
+        :param table: name of the table
+        """
+        self._column_types.pop(table, None)
+        for key, statement in list(self._templates.items()): 
+            if key[1] != table: 
+                continue
+            del self._templates[key]
+            name = _prepared_name(statement)
+            for prepared in list(self._prepared.values()): 
+                if name in prepared: 
+                    prepared[name] = False
+
+    def column_types(self, table): 
+        """
+        Looks up the SQL types of a table's columns, caching them per table. 
+        :param table: name of the table
+        :return: a dict mapping column names to their type
+        """
+        types = self._column_types.get(table)
+        if types is None: 
+            with self.cursor() as cursor: 
+                self.execute("""
+                SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute 
+                WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped;""", 
+                             (f"{self._schema}.{table}",), cursor)
+                types = dict(cursor.fetchall())
+            if types: 
+                self._column_types[table] = types
+        return types
+
+    def _values_template(self, table, columns): 
+        """
+        :return: the execute_values template for one row of a VALUES list. VALUES lists 
+        can't infer column types, so every value is cast to the column's type.
+        """
+        types = self.column_types(table)
+        return f"({', '.join(f'%s::{types[column]}' if column in types else '%s' for column in columns)})"
+
+    def execute_template(self, statement, args = (), cursor = None, write = False): 
+        """
+        Executes a templated statement. When preparing is enabled the statement is 
+        prepared once per connection and executed by name from then on. 
+        :param statement: statement from template()
+        :param args: the parameters for the statement
+        :param cursor: the cursor to execute on. Defaults to checking one out.
+        :param write: whether the statement is a write that a batch() may queue.
+        :return: whether the statement ran, or was queued, without an error
+        """
+        tx = self._transaction()
+        if write and tx is not None and tx.queue is not None: 
+            # mogrified on a cursor of its own, as checking one out flushes the queue
+            queue_cursor = tx.conn.cursor()
+            try: 
+                tx.queue.append(queue_cursor.mogrify(statement.rstrip().rstrip(";"), tuple(args) or None))
+            finally: 
+                queue_cursor.close()
+            return True
+
+        if cursor is None: 
+            with self.cursor() as cursor: 
+                return self.execute_template(statement, args, cursor, write)
+
+        conn = getattr(cursor, "connection", None)
+        if self._prepare and conn is not None and getattr(cursor, "name", None) is None: 
+            name = _prepared_name(statement)
+            prepared = self._prepared.setdefault(conn, {})
+            if prepared.get(name) is not True: 
+                try: 
+                    # a statement made stale by DDL is still allocated on the connection
+                    if prepared.pop(name, None) is False: 
+                        cursor.execute(f"DEALLOCATE {name};")
+                    cursor.execute(f"PREPARE {name} AS {_numbered(statement.rstrip(';'))};")
+                    prepared[name] = True
+                except psycopg2.Error as e: 
+                    logger.error("PREPARE: %s", e)
+            if prepared.get(name) is True: 
+                return self._execute(f"EXECUTE {name}" + (f" ({', '.join(['%s'] * len(args))});" if args else ";"), 
+                              tuple(args) or None, cursor, statement)
+
+        return self._execute(statement, tuple(args) or None, cursor)
         
     def cursor_gen(self): 
         """
@@ -163,58 +866,533 @@ class GenericDatabase:
             return conn.cursor()
 
         except Exception as e:
-            print(f"CURSOR GEN: {e}")
+            logger.error("CURSOR GEN: %s", e)
             return EmptyCursor()
 
+    def pool_gen(self, min_connections, max_connections, timeout = None): 
+        """
+        Generates a connection pool for the database. 
+        :return: a ConnectionPool. If an error is raised, None.
+        """
+
+        try: 
+            return ConnectionPool(min_connections, max_connections, timeout, host = self.__host, port = self.__port, 
+                                  user = self.__username, password = self.__password, database = self._db_name)
+        except Exception as e: 
+            logger.error("POOL GEN: %s", e)
+            return None
+
+    def cache_stats(self): 
+        """
+        :return: a dict of cache statistics from the cache backend.
+        """
+        return self._cache.stats()
+
+    def clear_cache(self): 
+        with self._flight_lock: 
+            self._cleared += 1
+        self._cache.clear()
+
+    def _generation(self, t_type): 
+        """
+        :return: a number that changes whenever the cache entries of a table are 
+        invalidated, or the cache is cleared
+        """
+        return self._cleared + self._generations.get(_table_of(t_type), 0)
+
+    def query_stats(self): 
+        """
+        :return: the stats of the metrics hook, or None if it doesn't keep any.
+        """
+        stats = getattr(self._metrics, "stats", None)
+        return None if stats is None else stats()
+
+    def _measured(self, operation, table, seconds, result, trace): 
+        """
+        Reports a finished operation to the metrics hook, and logs it if it was slow.
+        """
+        rows = _row_count(result)
+        if rows is None: 
+            rows = trace.rows
+        if self._metrics is not None: 
+            self._metrics.query(operation, table, seconds, rows, trace.fetched)
+        if self._slow_query is not None and seconds >= self._slow_query: 
+            logger.warning("slow query: %s on %s took %.3fs for %d rows%s", operation, table, seconds, rows, 
+                           "".join(f"\n  {elapsed:.3f}s {statement}" for statement, elapsed in trace.statements))
+
+    def _fetched(self, result): 
+        """
+        Adds the bytes of a fetched result to the operation being measured.
+        """
+        trace = getattr(self._local, "trace", None)
+        if trace is not None and self._metrics is not None: 
+            trace.fetched += result_bytes(result)
+
+    def _invalidate(self, t_type, rows = None, remote = False): 
+        """
+        Removes the cache entries a write could affect, and publishes the invalidation 
+        when cache coherence is on. 
+        :param t_type: row type, or table name, that was written to
+        :param rows: list of {column: value} dicts describing the affected rows. 
+        Defaults to None, removing every entry for the type.
+        :param remote: whether another process made the write, so it isn't published again
+        """
+        tx = self._transaction()
+        if tx is not None and not remote: 
+            tx.pending.append(lambda: self._invalidate(t_type, rows))
+            return
+
+        if isinstance(t_type, str): 
+            types = [t for t in self._cache.tables() if getattr(t, "table_name", lambda: None)() == t_type]
+        else: 
+            types = [t_type]
+
+        table = _table_of(t_type)
+        with self._flight_lock: 
+            self._generations[table] = self._generations.get(table, 0) + 1
+
+        if rows is not None and len(rows) > _SCOPE_LIMIT: 
+            rows = None
+        match = None if rows is None else _affects(rows)
+        for t in types: 
+            removed = self._cache.invalidate(t, match)
+            if self._metrics is not None: 
+                self._metrics.invalidation(_table_of(t), removed)
+
+        if self._notify_channel is not None and not remote: 
+            self._publish(table, rows)
+
+    def _publish(self, table, rows): 
+        """
+        Announces an invalidation to the other processes listening on the channel.
+        """
+        if table is None: 
+            return
+        payload = _notify_payload(self._origin, table, rows)
+        self.execute("SELECT pg_notify(%s, %s);", (self._notify_channel, payload))
+
+    def _notified(self, payload): 
+        """
+        Evicts the cache entries another process invalidated. Rows holding values 
+        JSON can't compare exactly, such as arrays, evict the whole table.
+        """
+        message = json.loads(payload, object_hook = _json_object)
+        if message.get("origin") == self._origin: 
+            return
+        rows = message.get("rows")
+        if rows is not None and any(isinstance(value, (list, dict)) for row in rows for value in row.values()): 
+            rows = None
+        self._invalidate(message["table"], rows, remote = True)
+
+    def listen(self, channel = "sedez_invalidate"): 
+        """
+        Turns on cache coherence: invalidations are published on the channel, and a 
+        background thread evicts the entries other processes invalidate. Processes 
+        must share the channel name. The whole cache is cleared whenever the listener 
+        reconnects, as it may have missed notifications. 
+        :param channel: name of the NOTIFY channel
+        :return: None
+        """
+        self.unlisten()
+        self._notify_channel = channel
+        self._listener = NotifyListener(channel, self._notified, self.clear_cache, host = self.__host, 
+                                        port = self.__port, user = self.__username, 
+                                        password = self.__password, database = self._db_name)
+        self._listener.start()
+
+    def unlisten(self): 
+        """
+        Stops publishing and listening for invalidations.
+        :return: None
+        """
+        self._notify_channel = None
+        if self._listener is not None: 
+            self._listener.stop()
+            self._listener = None
+
+    def _refresh(self, refresh, result, *args, **kwargs): 
+        """
+        Writes fresh entries back into the cache, once the current transaction commits. 
+        """
+        self._on_commit(lambda: refresh(self, result, *args, **kwargs))
+
+    def _on_commit(self, func): 
+        """
+        Calls func now, or once the current transaction commits.
+        """
+        tx = self._transaction()
+        if tx is not None: 
+            tx.pending.append(func)
+        else: 
+            func()
+
+    def _transaction(self): 
+        return getattr(self._local, "transaction", None)
+
+    def in_transaction(self): 
+        """
+        :return: whether the current thread is inside a transaction() or batch() block.
+        """
+        return self._transaction() is not None
+
+    @contextmanager
+    def transaction(self, batch = False): 
+        """
+        Runs the statements issued by this thread inside the block in one transaction. 
+        Cache invalidation is applied once, when the transaction commits; on rollback 
+        the cache is left untouched. Reads inside the block bypass the cache. Nested 
+        blocks join the outer transaction. 
+        :param batch: whether to queue insert_item, update_item and remove_rows 
+        statements and send them together when the block exits. See batch().
+        :return: None
+        """
+        tx = self._transaction()
+        if tx is not None: 
+            if batch and tx.queue is None: 
+                tx.queue = []
+                try: 
+                    yield
+                    self._flush_queue(tx)
+                finally: 
+                    tx.queue = None
+            else: 
+                yield
+            return
+
+        with self.connection() as conn: 
+            if conn is None: 
+                yield
+                return
+
+            tx = _Transaction(conn, batch)
+            conn.autocommit = False
+            self._local.transaction = tx
+            try: 
+                yield
+                self._flush_queue(tx)
+                if conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_INERROR: 
+                    raise psycopg2.DatabaseError("A statement failed, so the transaction was rolled back.")
+                conn.commit()
+            except BaseException: 
+                conn.rollback()
+                raise
+            finally: 
+                self._local.transaction = None
+                conn.autocommit = True
+
+        for update in tx.pending: 
+            update()
+
+    def _flush_queue(self, tx): 
+        """
+        Sends the writes a batch has queued so far, in one round-trip.
+        """
+        if not tx.queue: 
+            return
+        statement = b";\n".join(tx.queue) + b";"
+        del tx.queue[:]
+        cursor = tx.conn.cursor()
+        try: 
+            cursor.execute(statement)
+        finally: 
+            cursor.close()
+
+    def batch(self): 
+        """
+        Queues the insert_item, update_item and remove_rows calls made by this thread 
+        inside the block, and sends them in one round-trip and one transaction when it 
+        exits. Any other statement, such as a read or a bulk write, first sends the 
+        writes queued before it, so statements still run in the order they were issued. 
+        :return: a context manager
+        """
+        return self.transaction(batch = True)
+
+    def pool_stats(self): 
+        """
+        :return: a dict of connection pool statistics, or None if the database isn't pooled.
+        """
+        if self._pool is None: 
+            return None
+        return self._pool.stats()
+
+    @contextmanager
+    def connection(self): 
+        """
+        Checks out a connection for the duration of one operation. In pooled mode it is 
+        borrowed from the pool and returned afterwards, otherwise the shared connection 
+        is locked until the block exits. 
+        :return: a psycopg2 connection, or None if the database isn't connected.
+        """
+        tx = self._transaction()
+        if tx is not None: 
+            yield tx.conn
+            return
+
+        self._check_connection()
+        if self._pool is not None: 
+            conn = self._pool.getconn()
+            try: 
+                with self._holding(): 
+                    yield conn
+            finally: 
+                self._pool.putconn(conn)
+        else: 
+            with self._lock, self._holding(): 
+                yield self._conn
+
+    @contextmanager
+    def cursor(self): 
+        """
+        Checks out a cursor for the duration of one operation, so that threads never 
+        share a cursor's result state. 
+        :return: a psycopg2 cursor, or an EmptyCursor if the database isn't connected.
+        """
+        tx = self._transaction()
+        if tx is not None: 
+            self._flush_queue(tx)
+        else: 
+            self._check_connection()
+        if self._pool is not None or tx is not None: 
+            with self.connection() as conn: 
+                cursor = conn.cursor()
+                try: 
+                    yield cursor
+                finally: 
+                    cursor.close()
+        else: 
+            with self._lock, self._holding(): 
+                yield self.__cursor
+
+    @contextmanager
+    def _holding(self): 
+        """
+        Counts the connections the current thread has checked out. While it holds one, 
+        it doesn't wait on another thread's query, which may be waiting for that connection.
+        """
+        self._local.holding = getattr(self._local, "holding", 0) + 1
+        try: 
+            yield
+        finally: 
+            self._local.holding -= 1
+
+    def _check_connection(self): 
+        """
+        Reconnects a database that has lost its connection, before it is used.
+        :raises psycopg2.OperationalError: if it can't reconnect
+        """
+        if not self._reconnects or self.is_connected(): 
+            return
+        with self._lock: 
+            if not self.is_connected() and not self._reconnect(): 
+                raise psycopg2.OperationalError("The connection to the database was lost, and reconnecting failed.")
+
+    def _reconnect(self, conn = None): 
+        """
+        Replaces a dropped connection. In pooled mode the idle connections are closed 
+        instead, as they most likely dropped with it, and are reopened when next needed. 
+        :param conn: the connection that dropped. If it has already been replaced, or 
+        it is None and the current connection is still open, nothing is done.
+        :return: whether the database is connected afterwards
+        """
+        with self._lock: 
+            if self._pool_args is not None: 
+                if self._pool is None: 
+                    self._pool = self.pool_gen(*self._pool_args)
+                else: 
+                    self._pool.discard_idle()
+                connected = self._pool is not None
+            else: 
+                if self.is_connected() and conn is not self._conn: 
+                    return True
+                if self._conn is not None: 
+                    try: 
+                        self._conn.close()
+                    except psycopg2.Error: 
+                        pass
+                self._conn = None
+                self.__cursor = self.cursor_gen()
+                connected = self._conn is not None
+        self._connection_event("reconnect" if connected else "reconnect_failed")
+        return connected
+
+    def _connection_event(self, event): 
+        """
+        Counts a change in the state of the connection, and passes it to the metrics hook.
+        """
+        with self._stats_lock: 
+            if event == "disconnect": 
+                self._connection_stats["disconnects"] += 1
+                self._connection_stats["last_disconnect"] = time.time()
+            elif event == "reconnect": 
+                self._connection_stats["reconnects"] += 1
+            elif event == "reconnect_failed": 
+                self._connection_stats["reconnect_failures"] += 1
+            elif event == "retry": 
+                self._connection_stats["retries"] += 1
+        if self._metrics is not None: 
+            self._metrics.connection(event)
+
+    def connection_stats(self): 
+        """
+        :return: a dict of whether the database is connected, the times its connection 
+        dropped, reconnecting succeeded and failed, and reads were retried, and the 
+        time.time() of the last drop, or None.
+        """
+        with self._stats_lock: 
+            stats = dict(self._connection_stats)
+        stats["connected"] = self.is_connected()
+        return stats
+
+    @contextmanager
+    def server_cursor(self, batch_size = 1000): 
+        """
+        Checks out a named, server-side cursor, which keeps the result set on the server 
+        and fetches batch_size rows at a time, so the first rows arrive before the whole 
+        query has run. The cursor runs inside its own transaction, committed when the block 
+        exits, or joins the current one. On a shared connection, statements this thread 
+        issues inside the block run in that transaction too, and every other thread waits 
+        for the block to exit. 
+        :param batch_size: rows fetched per round-trip. 
+        :return: a psycopg2 named cursor, or an EmptyCursor if the database isn't connected.
+        """
+        tx = self._transaction()
+        if tx is not None: 
+            self._flush_queue(tx)
+        with self.connection() as conn: 
+            if conn is None: 
+                yield EmptyCursor()
+                return
+
+            name = f"sedez_{uuid4().hex}"
+            own_transaction = not self.in_transaction()
+            if own_transaction: 
+                conn.autocommit = False
+            cursor = conn.cursor(name)
+            cursor.itersize = batch_size
+
+            try: 
+                yield cursor
+            finally: 
+                try: 
+                    cursor.close()
+                    if own_transaction: 
+                        conn.commit()
+                finally: 
+                    if own_transaction: 
+                        conn.autocommit = True
+
     def is_connected(self):  
-        return self._conn.poll() == psycopg2.extensions.POLL_OK
+        """
+        Checks whether the database is connected, without a round-trip. A connection 
+        that dropped is only noticed once it is next used; see ping().
+        :return: bool
+        """
+        if self._pool is not None: 
+            return not self._pool.closed
+        return self._conn is not None and not self._conn.closed
+
+    def ping(self): 
+        """
+        Checks that the database answers, reconnecting if the connection has dropped.
+        :return: whether it answered
+        """
+        try: 
+            return self._ping()
+        except psycopg2.Error as e: 
+            logger.error("PING: %s", e)
+            return False
+
+    @retry
+    def _ping(self): 
+        with self.cursor() as cursor: 
+            return self._execute("SELECT 1;", cursor = cursor) and cursor.fetchone() is not None
     
-    def gen_row(self, t_type, result):
+    def gen_row(self, t_type, result, description = None):
         """
         Generates the type of role specified. 
         :param t_type: the type of row to generate
         :param result: the information to load the row with
+        :param description: the description of the cursor the result came from
         :return: the row, loaded with the result
         """
+        return self.row_factory(t_type, description)(result)
+
+    def row_factory(self, t_type, description = None): 
+        """
+        Gets the compiled function that builds rows from results, so that a query 
+        resolves the row type and its columns once rather than per row. 
+        :param t_type: the type of row to generate, or a table of them
+        :param description: the description of the cursor the results come from
+        :return: function taking a result tuple and returning the row
+        """
         try:
             t_type = t_type.row_type()
         except:
             pass
 
-        if t_type is not nRow:
-            return t_type(*result)
-        else:
-            if len(t_type.__columns__):
-                c_names = t_type.__columns__
-            else:
-                c_names = [desc[0] for desc in self.__cursor.description]
-            row = t_type(*result, columns = c_names)
-            return row
+        if t_type is not nRow or len(t_type.__columns__): 
+            return row_factory(t_type)
+        if description is None: 
+            description = self.__cursor.description
+        return row_factory(t_type, [desc[0] for desc in description])
 
-    def execute(self, statement, args = None):
+    def _column_table(self, t_type, result, description): 
+        """
+        Loads a ColumnTable straight from the result, without building rows.
+        """
+        columns = None if hasattr(t_type, "ROW_TYPE") else [desc[0] for desc in description]
+        return t_type.from_records(result, columns)
+
+    def execute(self, statement, args = None, cursor = None):
         """
         Executes an SQL statement to a pyscopg2 database. 
+        :param cursor: the cursor to execute on. Defaults to checking one out.
         :return: None
         """
+        self._execute(statement, args, cursor)
 
+    def _execute(self, statement, args = None, cursor = None, text = None): 
+        """
+        :param text: the statement to report in the slow query log. Defaults to statement.
+        :return: whether the statement ran without an error
+        """
+        if cursor is None: 
+            with self.cursor() as cursor: 
+                return self._execute(statement, args, cursor, text)
+
+        trace = getattr(self._local, "trace", None)
+        start = time.perf_counter()
         try: 
-            self.__cursor.execute(statement, args)
+            cursor.execute(statement, args)
+            return True
         except psycopg2.Error as e: 
-            print(e)
-            if e == 8006: 
-                self.__cursor = self.cursor_gen()
-                self.execute(statement, args)
+            logger.error("EXECUTE: %s", e)
+            conn = getattr(cursor, "connection", None)
+            if _disconnected(e, conn): 
+                self._connection_event("disconnect")
+                # a retried read reconnects itself. Anything else fails, and isn't rerun 
+                # in case it was applied, but the next statement gets a new connection
+                if getattr(self._local, "retrying", False): 
+                    raise
+                if not self.in_transaction(): 
+                    self._reconnect(conn)
         except Exception as e: 
-            print(f"EXECUTE: {e}")
+            logger.error("EXECUTE: %s", e)
+        finally: 
+            if trace is not None: 
+                trace.statements.append((statement if text is None else text, time.perf_counter() - start))
+                trace.rows += max(getattr(cursor, "rowcount", 0) or 0, 0)
+        return False
 
     def schema_exists(self): 
-        if self.is_connected():
-            self.execute("""
-            SELECT exists(SELECT schema_name FROM information_schema.schemata
-            WHERE schema_name = %s);""",
-                         (str(self._schema),))
+        with self.cursor() as cursor: 
+            if self.is_connected():
+                self.execute("""
+                SELECT exists(SELECT schema_name FROM information_schema.schemata
+                WHERE schema_name = %s);""",
+                             (str(self._schema),), cursor)
         
-        return self.__cursor.fetchone()[0]  
+            return cursor.fetchone()[0]  
         
     def create_schema(self, schema): 
         self.execute("""CREATE SCHEMA %s;""", 
@@ -222,6 +1400,8 @@ class GenericDatabase:
         
     # generic methods for managing a database
     @cache
+    @retry
+    @instrument
     def get_item(self, t_type, default = None, **kwargs):
         """
         Used to retrieve an item from the database. Always returns a row.  
@@ -236,139 +1416,437 @@ class GenericDatabase:
         """
         if not isinstance(t_type, type): 
             t_type = type(t_type) 
-        kwargs = self.and_convert(kwargs)
-        query = f"SELECT * FROM {self._schema}.{t_type.table_name()}"
-
-        if kwargs: 
-            query += kwargs
-        
-        query += " LIMIT 1;"
-        self.execute(query)
-        result = self.__cursor.fetchone()
+        query = self.template("select_one", t_type.table_name(), filters = _filter_key(kwargs))
+        with self.cursor() as cursor: 
+            self.execute_template(query, _filter_values(kwargs), cursor)
+            result = cursor.fetchone()
+            description = cursor.description
+        self._fetched(result)
         if result is None: 
             return default
 
-        if issubclass(t_type, Table): 
-            return self.gen_row(t_type, result)
-        else: 
-            try: 
-                return t_type(*result)
-            except Exception as e: 
-                print(f"GET ITEM: {e}")
+        try: 
+            return self.gen_row(t_type, result, description)
+        except Exception as e: 
+            logger.error("GET ITEM: %s", e)
 
     @cache
+    @retry
+    @instrument
     def get_items(self, t_type, default = None, **kwargs): 
         """
         Get several items from the database. 
         :param t_type: Type that should be returned. Subclasses Table or Row*. 
         :param default: Return type if nothing is found. Defaults to None. 
         :param kwargs: Parameters to filter by. 
-        :return: if t_type subclasses table, a table of the same type. If not, a row. 
+        :return: if t_type subclasses table, a table of the same type. If not, a list of rows. 
         """
-        kwargs = self.and_convert(kwargs)
-        query = f"SELECT * FROM {self._schema}.{t_type.table_name()}"
-        
-        if kwargs: 
-            query += kwargs
-        
-        self.execute(query)
-        result = self.__cursor.fetchall()
-        r = [] 
+        if not isinstance(t_type, type): 
+            t_type = type(t_type)
+        query = self.template("select", t_type.table_name(), filters = _filter_key(kwargs))
+        with self.cursor() as cursor: 
+            self.execute_template(query, _filter_values(kwargs), cursor)
+            result = cursor.fetchall()
+            description = cursor.description
+        self._fetched(result)
+        if issubclass(t_type, ColumnTable): 
+            return self._column_table(t_type, result, description)
 
         try: 
-            for res in result: 
-                r.append(self.gen_row(t_type, res))
-                print(res)
-            
-            return t_type(*r)
-        except: 
-            for res in result:
-                try: 
-                    r.append(t_type(*res))
-                except Exception as e: 
-                    print(f"GET ITEMS: {e}")
-            return r
+            r = list(map(self.row_factory(t_type, description), result))
+        except Exception as e: 
+            logger.error("GET ITEMS: %s", e)
+            return default
+        return t_type(*r) if issubclass(t_type, Table) else r
 
-    @invalidate
+    @retry
+    @instrument
+    def get_many(self, t_type, column, values): 
+        """
+        Retrieves the items for several keys in a single query. Keys already in the cache 
+        are served from it, and the rest are cached as if loaded by get_item. 
+        :param t_type: Type that should be returned. Subclasses Row or Table. 
+        :param column: the column to look the values up by
+        :param values: the values to look up. None values are ignored.
+        :return: a dict mapping each value that was found to its row
+        """
+        if not isinstance(t_type, type): 
+            t_type = type(t_type) 
+        r_type = _cache_type(t_type)
+        caching = not self.in_transaction()
+        found = {}
+        missing = []
+        for value in dict.fromkeys(values): 
+            if value is None: 
+                continue
+            res = self._cache.get(r_type, _cache_key("get_item", {column: value})) if caching else CACHE_MISS
+            if caching and self._metrics is not None: 
+                self._metrics.cache("get_many", t_type.table_name(), res is not CACHE_MISS)
+            if res is CACHE_MISS: 
+                missing.append(value)
+            elif res is not CACHE_NOT_FOUND: 
+                found[value] = res
+
+        if not missing: 
+            return found
+
+        generation = self._generation(r_type)
+        query = self.template("select_any", t_type.table_name(), (column,))
+        with self.cursor() as cursor: 
+            self.execute_template(query, (missing,), cursor)
+            result = cursor.fetchall()
+            description = cursor.description
+        self._fetched(result)
+
+        loaded = {}
+        factory = self.row_factory(t_type, description)
+        for res in result: 
+            row = factory(res)
+            loaded.setdefault(getattr(row, column), row)
+
+        # rows loaded while the table was written to may be stale, so they aren't kept
+        caching = caching and self._generation(r_type) == generation
+        for value in missing: 
+            row = loaded.get(value, CACHE_NOT_FOUND)
+            if caching: 
+                self._cache.set(r_type, _cache_key("get_item", {column: value}), row, negative = row is CACHE_NOT_FOUND)
+            if row is not CACHE_NOT_FOUND: 
+                found[value] = row
+        return found
+
+    @cache
+    @retry
+    @instrument
+    def get_page(self, t_type, *, order_by, after = None, limit = 20, descending = False, 
+                 key_columns = ("id",), **kwargs): 
+        """
+        Gets a page of items in order, seeking past the previous page with a keyset 
+        rather than an OFFSET, so every page costs the same to load. Each page is cached 
+        like get_items. 
+        :param t_type: Type that should be returned. Subclasses Table or Row*. 
+        :param order_by: the column, or tuple of columns, to order by. They should not 
+        hold NULLs, which are never paged past.
+        :param after: the token returned with the previous page, or None for the first page
+        :param limit: the most rows in a page
+        :param descending: whether to page from the largest values down
+        :param key_columns: the columns that make the order unique, added after order_by
+        :param kwargs: Parameters to filter by. 
+        :return: (page, token). The page is a table of the same type, or a list of rows 
+        if t_type isn't a table. The token gets the next page, and is None on the last one.
+        :raises ValueError: if after isn't a token for these columns
+        """
+        if not isinstance(t_type, type): 
+            t_type = type(t_type)
+        if isinstance(order_by, str): 
+            order_by = (order_by,)
+        columns = tuple(dict.fromkeys(tuple(order_by) + tuple(key_columns)))
+        operation = "page" if after is None else "page_after"
+        if descending: 
+            operation += "_desc"
+        args = _filter_values(kwargs)
+        if after is not None: 
+            args += _page_values(after, len(columns))
+        # one row past the page tells whether there is another
+        query = self.template(operation, t_type.table_name(), columns, _filter_key(kwargs))
+        with self.cursor() as cursor: 
+            self.execute_template(query, args + (limit + 1,), cursor)
+            result = cursor.fetchall()
+            description = cursor.description
+        self._fetched(result)
+
+        token = None
+        if len(result) > limit: 
+            result = result[:limit]
+            names = [desc[0] for desc in description]
+            last = result[-1]
+            token = _page_token(last[names.index(column)] for column in columns)
+
+        if issubclass(t_type, ColumnTable): 
+            return self._column_table(t_type, result, description), token
+        rows = list(map(self.row_factory(t_type, description), result))
+        if issubclass(t_type, Table): 
+            return t_type(*rows), token
+        return rows, token
+
+    @invalidate(scope = _update_scope)
+    @instrument
     def update_item(self, data, **kwargs):
-        kwargs = self.and_convert(kwargs)
-        query = f"UPDATE {self._schema}.{data.table_name()} SET "
-        for cr in data:
-            try:
-                for column in cr:
-                    if isinstance(getattr(cr, column), str):
-                        query += f"{column} = '{getattr(cr, column)}',"
-                    else:
-                        query += f"{column} = {getattr(cr, column)},"
-            except (TypeError, AttributeError):
-                if isinstance(getattr(data, cr), str):
-                    query += f"{cr} = '{getattr(data, cr)}',"
-                else:
-                    query += f"{cr} = {getattr(data, cr)},"
+        """
+        Update the rows matching the filters with the values of an item. Rows loaded 
+        from the database only SET the columns changed since, and send nothing when 
+        none have; once written they are marked clean. 
+        :param data: the data to write. Subclasses Row, or Table with a single row.
+        :param kwargs: Parameters to filter by. 
+        :return: whether anything was written
+        """
+        table = data.table_name()
+        if isinstance(data, Table): 
+            if len(data) != 1: 
+                logger.error("UPDATE ITEM: expected a single row, got %d.", len(data))
+                return False
+            data = data.__rows__[0]
 
-        query = query[:-1] + kwargs + ';'
-        self.execute(query)
+        values = tuple(getattr(data, column) for column in data.__columns__)
+        columns = data.dirty_columns()
+        if columns is None: 
+            columns = tuple(data.__columns__)
+        elif not columns: 
+            return False
+        query = self.template("update", table, columns, _filter_key(kwargs))
+        args = tuple(getattr(data, column) for column in columns) + _filter_values(kwargs)
+        if not self.execute_template(query, args, write = True): 
+            return False
+        self._on_commit(lambda: data.mark_clean(values))
+        return True
 
-    @invalidate
+    def save(self, data, key_columns = ("id",)): 
+        """
+        Writes the columns of a row changed since it was loaded back to the database, 
+        matching it by its key as loaded, so the key may be changed too. Rows that 
+        weren't loaded from the database are written in full. 
+        :param data: the row to save. Subclasses Row.
+        :param key_columns: the columns identifying the row. Defaults to ("id",).
+        :return: whether anything was written
+        """
+        loaded = getattr(data, "_loaded", None)
+        if loaded is None: 
+            keys = {column: getattr(data, column) for column in key_columns}
+        else: 
+            keys = {column: loaded[data.__columns__.index(column)] for column in key_columns}
+        return self.update_item(data, **keys)
+
+    @invalidate(scope = _insert_scope)
+    @instrument
     def insert_item(self, data):
         """
         Save an item to the database. 
         :param data: the data to load in. Subclasses Row or Table.  
         """
-        query = f"INSERT INTO {self._schema}.{data.table_name()} ({','.join(data.__columns__)}) VALUES ("
-
+        table = data.table_name()
         try: 
             if len(data.__rows__) == 1: 
                 data = data.__rows__[0]
             else: 
                 raise ValueError()
         except ValueError as e: 
-            print(f"INSERT ITEM: {e}")
+            logger.error("INSERT ITEM: %s", e)
         except Exception as e: 
             pass
         
-        for column in data.__columns__:
-            query += f"{getattr(data, column)},"
-        query = query[:-1]
-        query += ");"
-        self.execute(query)
+        columns = tuple(data.__columns__)
+        query = self.template("insert", table, columns)
+        values = tuple(getattr(data, column) for column in columns)
+        if self.execute_template(query, values, write = True) and isinstance(data, Row): 
+            self._on_commit(lambda: data.mark_clean(values))
 
-    @invalidate
-    def insert_items(self, data):
+    @invalidate(scope = _insert_scope)
+    @instrument
+    def insert_items(self, data, batch_size = 1000, method = "values"):
         """
-        Save several items off to the databse. 
-        :param data: The data to be saved. Expects a list or a class that subclasses data.
+        Save several items off to the databse, sending one statement per batch. 
+        :param data: The data to be saved. Expects a Table, or an iterable of Rows.
+        :param batch_size: rows sent per round-trip. Defaults to 1000.
+        :param method: "values" for multi-row INSERT ... VALUES statements, or "copy" 
+        for COPY ... FROM STDIN, which is faster for plain text and numeric columns.
         """
+        if isinstance(data, Row): 
+            data = [data]
+        rows = iter(data)
         try: 
-            for item in data.__rows__:
-                self.save_item(item)
-        except Exception: 
-            for item in data: 
-                self.save_item(data)
+            first = next(rows)
+        except StopIteration: 
+            return
 
-    @invalidate
+        columns = first.__columns__
+        table = f"{self._schema}.{first.table_name()}"
+        values = (tuple(getattr(row, column) for column in columns) for row in [first, *rows])
+
+        with self.cursor() as cursor: 
+            try: 
+                if method == "copy": 
+                    statement = f"COPY {table} ({','.join(columns)}) FROM STDIN"
+                    for batch in _batches(values, batch_size): 
+                        buffer = StringIO("".join("\t".join(map(_copy_value, value)) + "\n" for value in batch))
+                        cursor.copy_expert(statement, buffer)
+                else: 
+                    statement = f"INSERT INTO {table} ({','.join(columns)}) VALUES %s"
+                    psycopg2.extras.execute_values(cursor, statement, values, page_size = batch_size)
+            except Exception as e: 
+                logger.error("INSERT ITEMS: %s", e)
+
+    @invalidate(scope = _keys_scope)
+    @instrument
+    def update_items(self, data, key_columns = ("id",), batch_size = 1000): 
+        """
+        Update several items at once, each with its own values, sending one 
+        UPDATE ... FROM (VALUES ...) statement per batch. 
+        :param data: The data to be saved. Expects a Table, or an iterable of Rows.
+        :param key_columns: the columns rows are matched on, or the name of one. Defaults to ("id",).
+        :param batch_size: rows sent per round-trip. Defaults to 1000.
+        :return: the number of rows updated
+        """
+        if isinstance(data, Row): 
+            data = [data]
+        key_columns = (key_columns,) if isinstance(key_columns, str) else tuple(key_columns)
+        # a statement can't update the same row twice, so only the last row per key is kept
+        rows = list({tuple(getattr(row, column) for column in key_columns): row for row in data}.values())
+        if not rows: 
+            return 0
+
+        table = rows[0].table_name()
+        columns = tuple(rows[0].__columns__)
+        if all(column in key_columns for column in columns): 
+            # nothing to SET
+            return 0
+        query = self.template("update_from", table, columns, tuple((column, False) for column in key_columns))
+        row_template = self._values_template(table, columns)
+        values = (tuple(getattr(row, column) for column in columns) for row in rows)
+
+        updated = 0
+        with self.cursor() as cursor: 
+            try: 
+                for batch in _batches(values, batch_size): 
+                    psycopg2.extras.execute_values(cursor, query, batch, row_template, page_size = len(batch))
+                    updated += max(cursor.rowcount, 0)
+            except Exception as e: 
+                logger.error("UPDATE ITEMS: %s", e)
+        return updated
+
+    @invalidate(scope = _keys_scope, refresh = _keys_refresh)
+    @instrument
+    def upsert_item(self, data, key_columns = ("id",)): 
+        """
+        Insert an item, or update the existing row with the same key, in one statement. 
+        The stored row is written back into the cache. 
+        :param data: the data to save. Subclasses Row.
+        :param key_columns: the conflict target, which needs a unique index, or the name of its 
+        column. Defaults to ("id",).
+        :return: the row as stored, or None if it couldn't be saved
+        """
+        key_columns = (key_columns,) if isinstance(key_columns, str) else tuple(key_columns)
+        rows = self._upsert([data], key_columns, 1)
+        return rows[0] if rows else None
+
+    @invalidate(scope = _keys_scope, refresh = _keys_refresh)
+    @instrument
+    def upsert_items(self, data, key_columns = ("id",), batch_size = 1000): 
+        """
+        Insert several items, updating the existing rows with the same keys, sending one 
+        INSERT ... ON CONFLICT DO UPDATE statement per batch. The stored rows are written 
+        back into the cache. 
+        :param data: The data to be saved. Expects a Table, or an iterable of Rows.
+        :param key_columns: the conflict target, which needs a unique index, or the name of its 
+        column. Defaults to ("id",).
+        :param batch_size: rows sent per round-trip. Defaults to 1000.
+        :return: a list of the rows as stored
+        """
+        if isinstance(data, Row): 
+            data = [data]
+        key_columns = (key_columns,) if isinstance(key_columns, str) else tuple(key_columns)
+        # a statement can't update the same row twice, so only the last row per key is kept
+        rows = {tuple(getattr(row, column) for column in key_columns): row for row in data}
+        return self._upsert(list(rows.values()), key_columns, batch_size)
+
+    def _upsert(self, rows, key_columns, batch_size): 
+        if not rows: 
+            return []
+
+        r_type = type(rows[0])
+        columns = tuple(rows[0].__columns__)
+        query = self.template("upsert", rows[0].table_name(), columns, tuple((column, False) for column in key_columns))
+        values = [tuple(getattr(row, column) for column in columns) for row in rows]
+
+        with self.cursor() as cursor: 
+            try: 
+                result = psycopg2.extras.execute_values(cursor, query, values, page_size = batch_size, fetch = True)
+                description = cursor.description
+            except Exception as e: 
+                logger.error("UPSERT ITEMS: %s", e)
+                return []
+        self._fetched(result)
+        return list(map(self.row_factory(r_type, description), result))
+
+    @invalidate(scope = _keys_scope)
+    @instrument
+    def remove_items(self, data, key_columns = ("id",), batch_size = 1000): 
+        """
+        Remove several items at once by their keys, sending one DELETE ... USING (VALUES ...) 
+        statement per batch. 
+        :param data: The rows to remove. Expects a Table, or an iterable of Rows.
+        :param key_columns: the columns rows are matched on, or the name of one. Defaults to ("id",).
+        :param batch_size: rows sent per round-trip. Defaults to 1000.
+        :return: the number of rows removed
+        """
+        if isinstance(data, Row): 
+            data = [data]
+        key_columns = (key_columns,) if isinstance(key_columns, str) else tuple(key_columns)
+        rows = list(data)
+        if not rows: 
+            return 0
+
+        table = rows[0].table_name()
+        query = self.template("delete_from", table, filters = tuple((column, False) for column in key_columns))
+        row_template = self._values_template(table, key_columns)
+        values = (tuple(getattr(row, column) for column in key_columns) for row in rows)
+
+        removed = 0
+        with self.cursor() as cursor: 
+            try: 
+                for batch in _batches(values, batch_size): 
+                    psycopg2.extras.execute_values(cursor, query, batch, row_template, page_size = len(batch))
+                    removed += max(cursor.rowcount, 0)
+            except Exception as e: 
+                logger.error("REMOVE ITEMS: %s", e)
+        return removed
+
+    def sync_table(self, table, key_columns = ("id",), current = None, batch_size = 1000): 
+        """
+        Makes the database table match an in-memory one, sending only the difference: 
+        batched deletes, inserts and updates, in one transaction. 
+        :param table: the Table as it should be stored
+        :param key_columns: the columns identifying a row. Defaults to ("id",).
+        :param current: the table as it is stored, such as the version table was loaded 
+        from. Defaults to loading it.
+        :param batch_size: rows sent per round-trip. Defaults to 1000.
+        :return: the TableDiff that was applied
+        """
+        key_columns = (key_columns,) if isinstance(key_columns, str) else tuple(key_columns)
+        with self.transaction(): 
+            if current is None: 
+                current = self.load_table(type(table))
+            changes = table.diff(current, key_columns)
+            # deletes go first, so re-inserted keys don't conflict
+            if changes.deleted: 
+                self.remove_items(changes.deleted, key_columns, batch_size)
+            if changes.inserted: 
+                self.insert_items(changes.inserted, batch_size)
+            if changes.updated: 
+                self.update_items(changes.updated, key_columns, batch_size)
+        return changes
+
+    @invalidate(scope = _remove_scope)
+    @instrument
     def remove_rows(self, t_type, limit = None, **kwargs): 
         """
         Remove specified object from the database.
         :param t_type: type of object to be removed.
-        :param limit: limit on rows to remove.
+        :param limit: limit on rows to remove, or an (offset, limit) pair.
         :param kwargs: Parameters to filter by. 
         """
-        kwargs = self.and_convert(kwargs)
-        query = f"DELETE FROM {self._schema}.{t_type.table_name()}"
-
-        if kwargs: 
-            query += kwargs
-
-        if limit is not None: 
+        args = _filter_values(kwargs)
+        if limit is None: 
+            query = self.template("delete", t_type.table_name(), filters = _filter_key(kwargs))
+        else: 
+            query = self.template("delete_limit", t_type.table_name(), filters = _filter_key(kwargs))
             try: 
-                limit = f"{limit[0]}, {limit[1]}"
-            except ValueError: 
-                pass
-            query += f" LIMIT {limit}"
+                args += (limit[1], limit[0])
+            except TypeError: 
+                args += (limit, 0)
 
-        self.execute(query)
+        self.execute_template(query, args, write = True)
     
+    @retry
+    @instrument
     def load_table(self, t_type):
         """
         :param t_type: Type of table to load
@@ -377,13 +1855,115 @@ class GenericDatabase:
         if not isinstance(t_type, type):
             t_type = type(t_type)
 
-        query = f"SELECT * FROM {self._schema}.{t_type.table_name()};"
-        self.execute(query)
-        res = self.__cursor.fetchall()
-        r = []
-        for row in res: 
-            r.append(self.gen_row(t_type, row))
-        return t_type(*r)
+        query = self.template("select", t_type.table_name())
+        with self.cursor() as cursor: 
+            self.execute_template(query, cursor = cursor)
+            res = cursor.fetchall()
+            description = cursor.description
+        self._fetched(res)
+        if issubclass(t_type, ColumnTable): 
+            return self._column_table(t_type, res, description)
+        return t_type(*map(self.row_factory(t_type, description), res))
+
+    def load_snapshot(self, t_type, path, watermark_column = None, key_columns = ("id",)): 
+        """
+        Warm-starts a table from a snapshot file written by Table.dump, fetching only what 
+        changed since. The snapshot is rewritten when anything did, and replaced by a full 
+        load_table when it is missing, unreadable or can't be brought up to date. 
+        :param t_type: Type of table to load
+        :param path: the snapshot file
+        :param watermark_column: a column, such as an updated_at timestamp, set whenever a 
+        row is written. Rows at or past the snapshot's largest value are fetched and merged 
+        in by key. Without one, the snapshot is used as long as the row count matches.
+        :param key_columns: the columns identifying a row. Defaults to ("id",).
+        :return: the table
+        """
+        if not isinstance(t_type, type): 
+            t_type = type(t_type)
+        table_name = t_type.table_name()
+        try: 
+            header = SQLSnapshot.read_header(path)
+            table = t_type.load(path)
+            # rows are decoded as they're accessed, so a corrupt one is found here rather than by the caller
+            for row in table: 
+                pass
+        except (OSError, ValueError) as e: 
+            logger.info("LOAD SNAPSHOT: %s", e)
+            header = table = None
+
+        if table is not None and header["watermark_column"] == watermark_column: 
+            changed = []
+            if watermark_column is not None and header["watermark"] is not None: 
+                query = self.template("select_since", table_name, (watermark_column,))
+                with self.cursor() as cursor: 
+                    self.execute_template(query, (header["watermark"],), cursor)
+                    result = cursor.fetchall()
+                    description = cursor.description
+                changed = list(map(self.row_factory(t_type, description), result))
+            with self.cursor() as cursor: 
+                self.execute_template(self.template("count", table_name), cursor = cursor)
+                count = cursor.fetchone()
+
+            if changed: 
+                key_of = lambda row: tuple(getattr(row, column) for column in key_columns)
+                rows = {key_of(row): row for row in table}
+                rows.update((key_of(row), row) for row in changed)
+                table = t_type(*rows.values())
+            if count is not None and count[0] == len(table): 
+                if changed: 
+                    table.dump(path, watermark_column)
+                return table
+
+        table = self.load_table(t_type)
+        try: 
+            table.dump(path, watermark_column)
+        except OSError as e: 
+            logger.error("LOAD SNAPSHOT: %s", e)
+        return table
+
+    def iter_items(self, t_type, batch_size = 1000, **kwargs): 
+        """
+        Lazily iterates over the items matching the filters, in constant memory. The 
+        connection stays checked out until the iteration finishes or is closed, and on a 
+        shared connection every other thread waits until then, so close iterators that 
+        are abandoned early, e.g. with contextlib.closing. 
+        :param t_type: Type that should be returned. Subclasses Row or Table. 
+        :param batch_size: rows fetched per round-trip. 
+        :param kwargs: Parameters to filter by. 
+        :return: a generator of rows
+        """
+        for chunk in self._iter_chunks(t_type, batch_size, kwargs): 
+            yield from chunk
+
+    def iter_table(self, t_type, batch_size = 1000): 
+        """
+        Lazily iterates over a table in chunks, in constant memory. The connection stays 
+        checked out until the iteration finishes or is closed, and on a shared connection 
+        every other thread waits until then, so close iterators that are abandoned early, 
+        e.g. with contextlib.closing. 
+        :param t_type: Type of table to load
+        :param batch_size: rows per chunk, fetched in one round-trip. 
+        :return: a generator of tables of up to batch_size rows
+        """
+        if not isinstance(t_type, type):
+            t_type = type(t_type)
+
+        for chunk in self._iter_chunks(t_type, batch_size, {}): 
+            yield t_type(*chunk)
+
+    def _iter_chunks(self, t_type, batch_size, kwargs): 
+        if not isinstance(t_type, type):
+            t_type = type(t_type)
+
+        query = self.template("select", t_type.table_name(), filters = _filter_key(kwargs))
+        with self.server_cursor(batch_size) as cursor: 
+            self.execute_template(query, _filter_values(kwargs), cursor)
+            while True: 
+                res = cursor.fetchmany(batch_size)
+                if not res: 
+                    break
+                description = cursor.description
+                yield list(map(self.row_factory(t_type, description), res))
 
     def create_table(self, data, **columns): 
         """
@@ -398,6 +1978,7 @@ class GenericDatabase:
             key_list.append(f"{key} {columns[key]},\n")
         query = f"{query}{''.join(key_list)[:-2]});"
         self.execute(query)
+        self._forget_table(data.table_name())
 
         try: 
             self.insert_items(data)
@@ -413,10 +1994,10 @@ class GenericDatabase:
         Drop a table from the schema. 
         :param table: name or type of table to drop.
         """
-        if isinstance(table, str): 
-            self.execute(f"DROP TABLE {self._schema}.{table};")
-        else: 
-            self.execute(f"DROP TABLE {self._schema}.{table.table_name()};")
+        if not isinstance(table, str): 
+            table = table.table_name()
+        self.execute(f"DROP TABLE {self._schema}.{table};")
+        self._forget_table(table)
 
     @invalidate
     def remove_column(self, data, column):
@@ -431,7 +2012,9 @@ class GenericDatabase:
             data = data.table_name()
         
         self.execute(f"ALTER TABLE {self._schema}.{data} DROP COLUMN {column}")
+        self._forget_table(data)
 
+    @invalidate
     def add_column(self, data, column, column_type, default = None): 
         """
         Adds the specified column to the database and alters all existing local
@@ -451,6 +2034,7 @@ class GenericDatabase:
             data = data.table_name()
         
         self.execute(f"ALTER TABLE {data} ADD COLUMN {column} {column_type}{default}")
+        self._forget_table(data)
 
     def get_tables(self): 
         """
@@ -458,5 +2042,6 @@ class GenericDatabase:
         :return: a tuple containing strings.
         """
 
-        self.execute(f"SELECT table_name FROM information_schema.TABLES WHERE table_schema = '{self._schema}'")
-        return tuple([f[0] for f in self.__cursor.fetchall()])
+        with self.cursor() as cursor: 
+            self.execute("SELECT table_name FROM information_schema.TABLES WHERE table_schema = %s", (self._schema,), cursor)
+            return tuple([f[0] for f in cursor.fetchall()])
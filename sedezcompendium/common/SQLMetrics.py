@@ -0,0 +1,134 @@
+from abc import ABCMeta, abstractmethod
+from bisect import bisect_left
+import sys
+import threading
+
+
+# upper bounds, in seconds, of the latency histogram buckets. The last bucket is unbounded.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def result_bytes(rows):
+    """
+    Roughly estimates the bytes fetched for a result, from the sizes of its values.
+    :param rows: the fetched tuples, or a single tuple
+    :return: size in bytes
+    """
+    if rows is None:
+        return 0
+    if isinstance(rows, tuple):
+        rows = (rows,)
+    getsizeof = sys.getsizeof
+    return sum(getsizeof(value) for row in rows for value in row)
+
+
+class MetricsHook(metaclass = ABCMeta):
+    """
+    Receives the measurements taken by a GenericDatabase. Subclass it to forward them
+    to another metrics system.
+    """
+
+    @abstractmethod
+    def query(self, operation, table, seconds, rows, fetched):
+        """
+        Called once per database operation that reaches the database.
+        :param operation: name of the GenericDatabase method
+        :param table: name of the table it ran against, or None
+        :param seconds: time taken, including building the rows
+        :param rows: rows returned or written
+        :param fetched: estimated bytes fetched
+        """
+
+    @abstractmethod
+    def cache(self, operation, table, hit):
+        """
+        Called once per @cache lookup.
+        :param hit: whether the value was served from the cache
+        """
+
+    @abstractmethod
+    def invalidation(self, table, removed):
+        """
+        Called once per invalidation of a table's cache entries.
+        :param removed: the number of entries removed
+        """
+
+    def connection(self, event):
+        """
+        Called when the connection to the database changes state. Does nothing unless
+        overridden.
+        :param event: "disconnect", "reconnect", "reconnect_failed" or "retry"
+        """
+
+
+class QueryMetrics(MetricsHook):
+    """
+    Keeps counters and latency histograms in memory, per operation and table.
+    """
+
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        """
+        :param buckets: upper bounds of the latency histogram buckets, in seconds.
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._cache = {}
+        self._invalidations = {}
+        self._connections = {}
+
+    def query(self, operation, table, seconds, rows, fetched):
+        with self._lock:
+            entry = self._queries.get((operation, table))
+            if entry is None:
+                entry = self._queries[(operation, table)] = {
+                    "count": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "rows": 0,
+                    "bytes": 0,
+                    "histogram": [0] * (len(self.buckets) + 1),
+                }
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            if seconds > entry["max_seconds"]:
+                entry["max_seconds"] = seconds
+            entry["rows"] += rows
+            entry["bytes"] += fetched
+            entry["histogram"][bisect_left(self.buckets, seconds)] += 1
+
+    def cache(self, operation, table, hit):
+        with self._lock:
+            entry = self._cache.setdefault((operation, table), {"hits": 0, "misses": 0})
+            entry["hits" if hit else "misses"] += 1
+
+    def invalidation(self, table, removed):
+        with self._lock:
+            self._invalidations[table] = self._invalidations.get(table, 0) + removed
+
+    def connection(self, event):
+        with self._lock:
+            self._connections[event] = self._connections.get(event, 0) + 1
+
+    def stats(self):
+        """
+        :return: a dict of "queries" and "cache" stats keyed by (operation, table), the
+        cache entries invalidated per table under "invalidations", and the count of each
+        connection event under "connections". Histograms are lists of counts, one per
+        bucket plus one for slower queries.
+        """
+        with self._lock:
+            return {
+                "queries": {key: dict(entry, histogram = list(entry["histogram"]))
+                            for key, entry in self._queries.items()},
+                "cache": {key: dict(entry) for key, entry in self._cache.items()},
+                "invalidations": dict(self._invalidations),
+                "connections": dict(self._connections),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+            self._cache.clear()
+            self._invalidations.clear()
+            self._connections.clear()
@@ -0,0 +1,113 @@
+import logging
+import select
+import threading
+import psycopg2
+
+
+logger = logging.getLogger(__name__)
+
+
+class NotifyListener:
+    """
+    LISTENs on a channel from its own connection, in a background thread, and passes
+    the payload of every notification to a callback. The connection is reopened with
+    an increasing delay if it drops, and on_reconnect is called once it is back, as
+    notifications sent in between were missed.
+    """
+
+    def __init__(self, channel, callback, on_reconnect = None, poll_interval = 1.0, retry = 1.0,
+                 max_retry = 30.0, **connect_kwargs):
+        """
+        :param channel: name of the channel. Must be an identifier.
+        :param callback: function taking the payload of each notification
+        :param on_reconnect: function called after the connection is reopened
+        :param poll_interval: seconds to wait for a notification before checking whether
+        to stop.
+        :param retry: seconds to wait before the first attempt to reconnect, doubled
+        after every failed attempt up to max_retry.
+        :param connect_kwargs: arguments passed through to psycopg2.connect.
+        """
+        if not channel.isidentifier():
+            raise ValueError(f"{channel!r} is not a valid channel name.")
+        self.channel = channel
+        self.callback = callback
+        self.on_reconnect = on_reconnect
+        self.poll_interval = poll_interval
+        self.retry = retry
+        self.max_retry = max_retry
+        self._connect_kwargs = connect_kwargs
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        Starts listening, unless already listening.
+        """
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target = self._run, name = f"listen-{self.channel}", daemon = True)
+        self._thread.start()
+
+    def stop(self, timeout = None):
+        """
+        Stops listening and closes the connection.
+        :param timeout: seconds to wait for the thread to finish. Defaults to forever.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        conn.autocommit = True
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"LISTEN {self.channel};")
+        finally:
+            cursor.close()
+        return conn
+
+    def _run(self):
+        conn = None
+        dropped = False
+        delay = self.retry
+        while not self._stop.is_set():
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    delay = self.retry
+                    if dropped and self.on_reconnect is not None:
+                        self.on_reconnect()
+                if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                conn.poll()
+            except Exception as e:
+                logger.error("LISTEN: %s", e)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+                dropped = True
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_retry)
+                continue
+
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                if notify.channel != self.channel:
+                    continue
+                try:
+                    self.callback(notify.payload)
+                except Exception as e:
+                    logger.error("NOTIFY: %s", e)
+
+        if conn is not None:
+            conn.close()
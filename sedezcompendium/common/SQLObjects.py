@@ -1,9 +1,113 @@
 from abc import ABCMeta
+from array import array
+from collections import Counter, namedtuple
+from itertools import compress
+from operator import attrgetter
+import keyword
+import operator
 import warnings
 
+try: 
+    import numpy
+except ImportError: 
+    numpy = None
+
+
+def _slottable(column): 
+    return column.isidentifier() and not keyword.iskeyword(column) and not column.startswith("__")
+
+
+def _columns_init(columns): 
+    """
+    Compiles an __init__ assigning each column from the row in turn, which is 
+    faster than setting them in a loop.
+    :param columns: the columns of the row
+    :return: the __init__ function
+    """
+    body = "".join(f"\n    self.{column} = row[{i}]" for i, column in enumerate(columns))
+    namespace = {}
+    exec(f"def __init__(self, *row):{body}", namespace)
+    init = namespace["__init__"]
+    init.__columns__ = tuple(columns)
+    return init
+
+
+def _generic_init(bases): 
+    """
+    :return: whether the __init__ inherited from bases is Row's own or a compiled one
+    """
+    for base in bases: 
+        for cls in base.__mro__: 
+            init = cls.__dict__.get("__init__")
+            if init is not None: 
+                return cls is Row or hasattr(init, "__columns__")
+    return False
+
+
+class RowMeta(ABCMeta): 
+    """
+    Gives Row subclasses that declare their __columns__ a slot per column instead 
+    of an instance __dict__, and a compiled __init__. Rows whose columns are only 
+    known per instance, or whose columns aren't identifiers or clash with class 
+    attributes, keep a __dict__. 
+    """
+
+    def __new__(mcs, name, bases, namespace, **kwargs): 
+        columns = namespace.get("__columns__")
+        if columns is None: 
+            columns = next((base.__columns__ for base in bases if hasattr(base, "__columns__")), ())
+        columns = tuple(columns)
+        if "__slots__" not in namespace and columns and all(_slottable(column) for column in columns) \
+                and not any(column in namespace for column in columns): 
+            slotted = {slot for base in bases for cls in base.__mro__ for slot in getattr(cls, "__slots__", ())}
+            namespace["__slots__"] = tuple(column for column in columns if column not in slotted)
+            # a constructor of the row's own, or inherited from a base, is kept
+            if "__init__" not in namespace and _generic_init(bases): 
+                namespace["__init__"] = _columns_init(columns)
+        return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+    def __setattr__(cls, name, value): 
+        super().__setattr__(name, value)
+        # keeps a compiled __init__ in step when columns are removed
+        init = cls.__dict__.get("__init__")
+        if name == "__columns__" and hasattr(init, "__columns__") and init.__columns__ != tuple(value): 
+            if all(hasattr(cls, column) for column in value): 
+                super().__setattr__("__init__", _columns_init(value))
+            else: 
+                delattr(cls, "__init__")
+
+
+def _index_add(index, unique, value, row, column): 
+    if not unique: 
+        index.setdefault(value, []).append(row)
+    elif value in index: 
+        raise ValueError(f"{column} = {value!r} is already in the unique index.")
+    else: 
+        index[value] = row
+
+
+def _index_remove(index, unique, value, row): 
+    if unique: 
+        if index.get(value) is row: 
+            del index[value]
+        return
+    rows = index.get(value, [])
+    for i, other in enumerate(rows): 
+        if other is row: 
+            del rows[i]
+            break
+    if not rows: 
+        index.pop(value, None)
+
+
+TableDiff = namedtuple("TableDiff", ("inserted", "updated", "deleted"))
+
+
 # thanks to @Craftspider for the initial form of the Row class
 
-class Row(metaclass = ABCMeta):
+class Row(metaclass = RowMeta):
+    # _loaded holds the values last read from or written to the database
+    __slots__ = ("_loaded",)
     __columns__ = ()
 
     def __init__(self, *row):
@@ -51,6 +155,27 @@ class Row(metaclass = ABCMeta):
     def __iter__(self):
         return iter(self.__columns__)
 
+    def mark_clean(self, values = None): 
+        """
+        Records the values the database holds for the row, which dirty_columns() 
+        compares against. 
+        :param values: the stored values, in column order. Defaults to the current values.
+        """
+        if values is None: 
+            values = tuple(getattr(self, column) for column in self.__columns__)
+        self._loaded = values
+
+    def dirty_columns(self): 
+        """
+        :return: the columns changed since the row was loaded from or saved to the 
+        database, or None if it wasn't. Values changed in place, such as an appended 
+        list, aren't noticed.
+        """
+        loaded = getattr(self, "_loaded", None)
+        if loaded is None: 
+            return None
+        return tuple(column for column, value in zip(self.__columns__, loaded) if getattr(self, column) != value)
+
     @classmethod
     def table_name(cls): 
         if hasattr(cls, "TABLE_NAME"):
@@ -146,11 +271,136 @@ class Table(metaclass = ABCMeta):
         return iter(self.__rows__)
 
     def __contains__(self, other): 
+        indexes = self.__dict__.get("_indexes")
+        if indexes and isinstance(other, Row): 
+            column, (unique, index) = next(iter(indexes.items()))
+            try: 
+                value = getattr(other, column)
+                if unique: 
+                    candidate = index.get(value)
+                    return candidate is not None and candidate == other
+                return other in index.get(value, ())
+            except (AttributeError, TypeError): 
+                pass
+        elif isinstance(other, Row) and type(other).__hash__ is not None: 
+            try: 
+                members = self.__dict__.get("_members")
+                if members is None: 
+                    members = self._members = Counter(self.__rows__)
+                return other in members
+            except TypeError: 
+                pass
         return other in self.__rows__
 
     def __len__(self):
         return len(self.__rows__)
 
+    def create_index(self, column, unique = False): 
+        """
+        Indexes the rows by a column, so lookup() and membership tests take constant time. 
+        add_row and remove_row keep the index up to date; call reindex() after changing 
+        the indexed column of a row in place. 
+        :param column: the column to index
+        :param unique: whether each value belongs to at most one row. 
+        :raises ValueError: if unique and a value is repeated.
+        """
+        index = {}
+        for row in self.__rows__: 
+            _index_add(index, unique, getattr(row, column), row, column)
+        self.__dict__.setdefault("_indexes", {})[column] = (unique, index)
+
+    def drop_index(self, column): 
+        self.__dict__.get("_indexes", {}).pop(column, None)
+
+    def reindex(self): 
+        """
+        Rebuilds the indexes, for after rows have been changed in place.
+        """
+        for column, (unique, index) in list(self.__dict__.get("_indexes", {}).items()): 
+            self.create_index(column, unique)
+        self.__dict__.pop("_members", None)
+
+    def lookup(self, column, value, default = None): 
+        """
+        Finds rows by the value of a column, through its index if it has one. 
+        :param column: the column to search
+        :param value: the value to find
+        :param default: returned by a unique index when no row has the value. 
+        :return: for a unique index, the row with the value, or default. Otherwise a 
+        list of the rows with the value, which without an index is found by scanning.
+        """
+        entry = self.__dict__.get("_indexes", {}).get(column)
+        if entry is None: 
+            return [row for row in self if getattr(row, column) == value]
+        unique, index = entry
+        if unique: 
+            return index.get(value, default)
+        return list(index.get(value, ()))
+
+    def dump(self, path, watermark_column = None): 
+        """
+        Writes the table to a binary snapshot file. See SQLSnapshot.dump.
+        :return: the header that was written
+        """
+        from .SQLSnapshot import dump
+        return dump(self, path, watermark_column)
+
+    @classmethod
+    def load(cls, path, t_type = None): 
+        """
+        Reads a table from a snapshot file, memory-mapped and decoding rows as they're 
+        accessed. See SQLSnapshot.load. 
+        :param t_type: the type of table to load. Defaults to this class.
+        """
+        from .SQLSnapshot import load
+        return load(path, cls if t_type is None else t_type)
+
+    def diff(self, other, key_columns = ("id",)): 
+        """
+        Compares the table with an earlier version of it, matching rows by their keys. 
+        :param other: the earlier version, as a Table or iterable of rows
+        :param key_columns: the column, or columns, identifying a row. Defaults to ("id",).
+        :return: a TableDiff of the rows only in this table (inserted), the rows of this 
+        table whose values differ from the earlier version (updated), and the rows only 
+        in the earlier version (deleted)
+        :raises ValueError: if a key is repeated within either version.
+        """
+        if isinstance(key_columns, str): 
+            key_columns = (key_columns,)
+        key_of = attrgetter(*key_columns)
+        columns = self.__columns__ or getattr(other, "__columns__", ())
+        if columns: 
+            values_of = attrgetter(*columns)
+        else: 
+            values_of = lambda row: tuple(getattr(row, column) for column in row.__columns__)
+
+        before = {}
+        for row in other: 
+            key = key_of(row)
+            if key in before: 
+                raise ValueError(f"{key_columns} = {key!r} is repeated in the earlier version.")
+            before[key] = row
+
+        inserted = []
+        updated = []
+        seen = set()
+        for row in self: 
+            key = key_of(row)
+            if key in seen: 
+                raise ValueError(f"{key_columns} = {key!r} is repeated.")
+            seen.add(key)
+            old = before.pop(key, None)
+            if old is None: 
+                inserted.append(row)
+            elif values_of(old) != values_of(row): 
+                updated.append(row)
+        return TableDiff(inserted, updated, list(before.values()))
+
+    def _check_unique(self, row): 
+        for column, (unique, index) in self.__dict__.get("_indexes", {}).items(): 
+            if unique and getattr(row, column) in index: 
+                raise ValueError(f"{column} = {getattr(row, column)!r} is already in the unique index.")
+
     @classmethod
     def table_name(cls): 
         if hasattr(cls, "TABLE_NAME"):
@@ -171,9 +421,16 @@ class Table(metaclass = ABCMeta):
 
     def remove_row(self, row):
         try:
-            self.__rows__.remove(row)
+            removed = self.__rows__.pop(self.__rows__.index(row))
         except:
-            pass
+            return
+        for column, (unique, index) in self.__dict__.get("_indexes", {}).items(): 
+            _index_remove(index, unique, getattr(removed, column), removed)
+        members = self.__dict__.get("_members")
+        if members is not None: 
+            members[removed] -= 1
+            if members[removed] <= 0: 
+                del members[removed]
 
     @classmethod
     def remove_column(cls, column_name):
@@ -198,7 +455,331 @@ class Table(metaclass = ABCMeta):
 
     def add_row(self, row):
         self.check_row(row)
+        self._check_unique(row)
         self.__rows__.append(row)
+        for column, (unique, index) in self.__dict__.get("_indexes", {}).items(): 
+            _index_add(index, unique, getattr(row, column), row, column)
+        members = self.__dict__.get("_members")
+        if members is not None: 
+            members[row] += 1
+
+
+_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def _column_array(values): 
+    """
+    Packs the values of a column into a contiguous array: a NumPy array when NumPy is 
+    installed, otherwise an array for int and float columns and a list for anything else.
+    :param values: list of the column's values
+    """
+    kinds = set(map(type, values))
+    if numpy is not None: 
+        try: 
+            if kinds and kinds <= {int}: 
+                return numpy.array(values, dtype = numpy.int64)
+            if kinds and kinds <= {int, float}: 
+                return numpy.array(values, dtype = numpy.float64)
+            if kinds == {bool}: 
+                return numpy.array(values, dtype = bool)
+        except OverflowError: 
+            pass
+        column = numpy.empty(len(values), dtype = object)
+        column[:] = values
+        return column
+
+    try: 
+        if kinds and kinds <= {int}: 
+            return array("q", values)
+        if kinds and kinds <= {int, float}: 
+            return array("d", values)
+    except OverflowError: 
+        pass
+    return list(values)
+
+
+def _to_list(column): 
+    return column if isinstance(column, list) else column.tolist()
+
+
+def _scalar(value): 
+    # NumPy scalars are handed out as the Python values they hold
+    return value.item() if hasattr(value, "item") else value
+
+
+class ColumnTable(Table): 
+    """
+    A Table that keeps each column in a contiguous array, NumPy's when it is installed, 
+    so filters, sorts and aggregates run over whole columns instead of row by row. Rows 
+    are only built when they are accessed. Appending and removing rows copies every 
+    column, so it suits tables that are loaded and then read. 
+    """
+
+    @classmethod
+    def row_type(cls): 
+        return getattr(cls, "ROW_TYPE", nRow)
+
+    def __init__(self, *args): 
+        if self.__class__ == ColumnTable: 
+            raise TypeError("Abstract classes cannot be instantized.")
+
+        if hasattr(self, "ROW_TYPE"): 
+            self.__columns__ = getattr(self, "ROW_TYPE").__columns__
+        elif len(args): 
+            self.__columns__ = args[0].__columns__
+            setattr(self, "ROW_TYPE", type(args[0]))
+        for row in args: 
+            self.check_row(row)
+        self._set_columns({column: [getattr(row, column) for row in args] for column in self.__columns__})
+
+    @classmethod
+    def from_records(cls, records, columns = None): 
+        """
+        Builds a table straight from result tuples, without building Rows. 
+        :param records: sequence of tuples, in column order
+        :param columns: the column names. Defaults to the ROW_TYPE's columns.
+        :return: the table
+        """
+        table = cls.__new__(cls)
+        if columns is not None: 
+            table.__columns__ = tuple(columns)
+        elif hasattr(cls, "ROW_TYPE"): 
+            table.__columns__ = getattr(cls, "ROW_TYPE").__columns__
+        values = list(zip(*records)) if len(records) else [()] * len(table.__columns__)
+        table._set_columns({column: list(values[i]) for i, column in enumerate(table.__columns__)})
+        return table
+
+    def _set_columns(self, data): 
+        self._data = {column: _column_array(values) for column, values in data.items()}
+
+    def _with_data(self, data): 
+        table = self.__class__.__new__(self.__class__)
+        table.__dict__.update(self.__dict__)
+        table.__dict__.pop("_indexes", None)
+        table._data = data
+        return table
+
+    def _row(self, values): 
+        row_type = getattr(self, "ROW_TYPE", nRow)
+        if row_type is nRow: 
+            return nRow(*values, columns = self.__columns__)
+        return row_type(*values)
+
+    @property
+    def __rows__(self): 
+        return list(self)
+
+    def column(self, name): 
+        """
+        :return: the array holding a column
+        """
+        return self._data[name]
+
+    def __len__(self): 
+        if not self.__columns__: 
+            return 0
+        return len(self._data[self.__columns__[0]])
+
+    def __iter__(self): 
+        columns = [_to_list(self._data[column]) for column in self.__columns__]
+        for values in zip(*columns): 
+            yield self._row(values)
+
+    def __getitem__(self, index): 
+        if isinstance(index, slice): 
+            return self._take(range(len(self))[index])
+        return self._row(tuple(_scalar(self._data[column][index]) for column in self.__columns__))
+
+    def __contains__(self, other): 
+        indexes = self.__dict__.get("_indexes")
+        try: 
+            if indexes: 
+                column, (unique, index) = next(iter(indexes.items()))
+                positions = index.get(getattr(other, column), ())
+                if unique: 
+                    positions = (positions,) if isinstance(positions, int) else ()
+                return any(self[position] == other for position in positions)
+            return len(self.filter(**{column: getattr(other, column) for column in self.__columns__})) > 0
+        except AttributeError: 
+            return False
+
+    def create_index(self, column, unique = False): 
+        """
+        Indexes the row positions by a column, so lookup() takes constant time. 
+        See Table.create_index.
+        """
+        index = {}
+        for position, value in enumerate(_to_list(self._data[column])): 
+            _index_add(index, unique, value, position, column)
+        self.__dict__.setdefault("_indexes", {})[column] = (unique, index)
+
+    def lookup(self, column, value, default = None): 
+        """
+        See Table.lookup. Without an index, the column is compared all at once.
+        """
+        entry = self.__dict__.get("_indexes", {}).get(column)
+        if entry is None: 
+            return list(self.filter(**{column: value}))
+        unique, index = entry
+        if unique: 
+            position = index.get(value)
+            return default if position is None else self[position]
+        return [self[position] for position in index.get(value, ())]
+
+    def mask(self, column, op, value = None): 
+        """
+        Compares every value of a column at once. 
+        :param column: the column to compare
+        :param op: one of "==", "!=", "<", "<=", ">", ">=", "in", or a predicate on a single value
+        :param value: the value to compare against, or for "in" a collection of values
+        :return: a boolean mask, a NumPy array when NumPy is installed and otherwise a list
+        """
+        data = self._data[column]
+        if numpy is not None: 
+            if callable(op): 
+                return numpy.fromiter(map(op, data), dtype = bool, count = len(data))
+            if op == "in": 
+                return numpy.isin(data, list(value))
+            return numpy.asarray(_OPERATORS[op](data, value), dtype = bool)
+
+        if callable(op): 
+            return [bool(op(v)) for v in data]
+        if op == "in": 
+            value = set(value)
+            return [v in value for v in data]
+        compare = _OPERATORS[op]
+        return [compare(v, value) for v in data]
+
+    def _combine(self, masks, kwargs): 
+        masks = list(masks) + [self.mask(column, "==", value) for column, value in kwargs.items()]
+        if not masks: 
+            return None
+        if numpy is not None: 
+            return numpy.logical_and.reduce([numpy.asarray(mask, dtype = bool) for mask in masks])
+        return [all(values) for values in zip(*masks)]
+
+    def _take(self, indices): 
+        if numpy is not None: 
+            indices = numpy.asarray(indices, dtype = numpy.intp)
+            return self._with_data({column: data[indices] for column, data in self._data.items()})
+        data = {}
+        for column, values in self._data.items(): 
+            taken = [values[i] for i in indices]
+            data[column] = array(values.typecode, taken) if isinstance(values, array) else taken
+        return self._with_data(data)
+
+    def filter(self, *masks, **kwargs): 
+        """
+        Selects the rows matching every mask and every column = value filter. 
+        :param masks: boolean masks, as returned by mask()
+        :param kwargs: column values to filter by
+        :return: a table of the same type with the matching rows
+        """
+        mask = self._combine(masks, kwargs)
+        if mask is None: 
+            return self._with_data(dict(self._data))
+        if numpy is not None: 
+            return self._with_data({column: data[mask] for column, data in self._data.items()})
+        return self._take(list(compress(range(len(self)), mask)))
+
+    def sort_by(self, column, reverse = False): 
+        """
+        :param column: the column to sort by
+        :param reverse: whether to sort in descending order
+        :return: a table of the same type with the rows sorted, keeping the order of ties
+        """
+        data = self._data[column]
+        if numpy is not None and data.dtype != object: 
+            if not reverse: 
+                return self._take(numpy.argsort(data, kind = "stable"))
+            # sorting the reversed column and reversing the order keeps ties in their original order
+            return self._take(len(data) - 1 - numpy.argsort(data[::-1], kind = "stable")[::-1])
+        return self._take(sorted(range(len(data)), key = data.__getitem__, reverse = reverse))
+
+    def _values(self, column, masks, kwargs): 
+        data = self._data[column]
+        mask = self._combine(masks, kwargs)
+        if mask is not None: 
+            data = data[mask] if numpy is not None else list(compress(data, mask))
+        # NULLs are skipped, as SQL aggregates do
+        if (numpy is not None and data.dtype != object) or isinstance(data, array): 
+            return data
+        return _column_array([value for value in data if value is not None])
+
+    def sum(self, column, *masks, **kwargs): 
+        """
+        NULLs are skipped, as they are by the other aggregates. 
+        :param column: the column to add up
+        :param masks: and kwargs, filters as in filter(). Defaults to every row.
+        """
+        values = self._values(column, masks, kwargs)
+        return _scalar(values.sum()) if numpy is not None else sum(values)
+
+    def min(self, column, *masks, **kwargs): 
+        """
+        :return: the smallest value of a column, or None if there are no rows that aren't NULL
+        """
+        values = self._values(column, masks, kwargs)
+        if not len(values): 
+            return None
+        return _scalar(values.min()) if numpy is not None else min(values)
+
+    def max(self, column, *masks, **kwargs): 
+        """
+        :return: the largest value of a column, or None if there are no rows that aren't NULL
+        """
+        values = self._values(column, masks, kwargs)
+        if not len(values): 
+            return None
+        return _scalar(values.max()) if numpy is not None else max(values)
+
+    def mean(self, column, *masks, **kwargs): 
+        """
+        :return: the mean of a column, or None if there are no rows that aren't NULL
+        """
+        values = self._values(column, masks, kwargs)
+        if not len(values): 
+            return None
+        return _scalar(values.mean()) if numpy is not None else sum(values) / len(values)
+
+    def add_row(self, row): 
+        self.check_row(row)
+        self._check_unique(row)
+        data = {column: _to_list(values) for column, values in self._data.items()}
+        for column in self.__columns__: 
+            data[column].append(getattr(row, column))
+        self._set_columns(data)
+        for column, (unique, index) in self.__dict__.get("_indexes", {}).items(): 
+            _index_add(index, unique, getattr(row, column), len(self) - 1, column)
+
+    def remove_row(self, row): 
+        try: 
+            index = next(i for i, other in enumerate(self) if other == row)
+        except StopIteration: 
+            return
+        self._data = self._take([i for i in range(len(self)) if i != index])._data
+        # positions after the removed row have shifted
+        self.reindex()
+
+    def remove_column(self, column_name): 
+        self._data.pop(column_name, None)
+        self.drop_index(column_name)
+        self.__columns__ = tuple(column for column in self.__columns__ if column != column_name)
+
+    def add_column(self, column_name, column_type = None): 
+        self._data[column_name] = _column_array([None] * len(self))
+        self.__columns__ = self.__columns__ + (column_name,)
+
+
+# column tuples shared between nRows with the same columns
+_nrow_columns = {}
 
 
 class nRow(Row): 
@@ -210,5 +791,52 @@ class nRow(Row):
         if columns is not None: 
             for i in columns: 
                 c.append(i)
-        self.__columns__ = tuple(c)
-        super().__init__(*list(rows))
\ No newline at end of file
+        c = tuple(c)
+        self.__columns__ = _nrow_columns.setdefault(c, c)
+        super().__init__(*list(rows))
+
+# compiled row factories, by row type, its columns and the result's columns
+_row_factories = {}
+
+
+def _compile_factory(row_type, columns): 
+    """
+    :return: a function building a row_type from a result tuple, assigning the 
+    columns in order, or calling the constructor when the row type defines its own.
+    """
+    init = row_type.__init__
+    if row_type is nRow or init is Row.__init__ or getattr(init, "__columns__", None) == columns: 
+        lines = []
+        if row_type is nRow: 
+            lines.append("row.__columns__ = columns")
+        for i, column in enumerate(columns): 
+            if _slottable(column): 
+                lines.append(f"row.{column} = result[{i}]")
+            else: 
+                lines.append(f"setattr(row, {column!r}, result[{i}])")
+        body = "".join(f"\n    {line}" for line in ["row = new(cls)"] + lines + ["row._loaded = result", "return row"])
+    else: 
+        body = "\n    row = cls(*result)\n    row._loaded = result\n    return row"
+    namespace = {"cls": row_type, "new": row_type.__new__, "columns": columns}
+    exec(f"def factory(result):{body}", namespace)
+    return namespace["factory"]
+
+
+def row_factory(row_type, columns = ()): 
+    """
+    Gets the function that builds rows of a type from result tuples, compiling it 
+    the first time. The rows are marked as loaded with the tuple.
+    :param row_type: the type of row. Subclasses Row.
+    :param columns: the names of the result's columns, which an nRow without 
+    declared columns takes as its own
+    :return: function taking a result tuple and returning the row
+    """
+    declared = tuple(row_type.__columns__)
+    if row_type is nRow and not declared: 
+        declared = tuple(columns)
+        declared = _nrow_columns.setdefault(declared, declared)
+    key = (row_type, declared)
+    factory = _row_factories.get(key)
+    if factory is None: 
+        factory = _row_factories[key] = _compile_factory(row_type, declared)
+    return factory
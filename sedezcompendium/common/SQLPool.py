@@ -0,0 +1,135 @@
+import threading
+import time
+import psycopg2
+import psycopg2.pool
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of psycopg2 connections. Unlike the psycopg2 pools,
+    callers wait for a free connection instead of failing once the pool is exhausted.
+    """
+
+    def __init__(self, min_connections, max_connections, timeout = None, **connect_kwargs):
+        """
+        :param min_connections: connections opened up front.
+        :param max_connections: most connections that may be checked out at once. Once
+        opened, connections are kept open for reuse up to this many.
+        :param timeout: seconds to wait for a free connection. Defaults to waiting forever.
+        :param connect_kwargs: arguments passed through to psycopg2.connect.
+        """
+        if max_connections < 1 or min_connections > max_connections:
+            raise ValueError("max_connections must be at least 1 and no less than min_connections.")
+
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._pool = psycopg2.pool.ThreadedConnectionPool(min_connections, max_connections, **connect_kwargs)
+        # psycopg2 closes returned connections once minconn are idle, so a burst past
+        # min_connections would open and close a connection per checkout
+        self._pool.minconn = max_connections
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "timeouts": 0,
+            "discarded": 0,
+            "peak_in_use": 0,
+        }
+
+    @property
+    def closed(self):
+        return self._pool.closed
+
+    def getconn(self):
+        """
+        Borrows a connection from the pool, blocking until one is available.
+        :return: a psycopg2 connection in autocommit mode.
+        """
+        start = time.perf_counter()
+        waited = not self._slots.acquire(blocking = False)
+        if waited:
+            if not self._slots.acquire(timeout = self.timeout):
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise psycopg2.pool.PoolError("Timed out waiting for a pooled connection.")
+
+        try:
+            conn = self._pool.getconn()
+            if not conn.autocommit:
+                conn.autocommit = True
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_time"] += time.perf_counter() - start
+            if self._in_use > self._stats["peak_in_use"]:
+                self._stats["peak_in_use"] = self._in_use
+        return conn
+
+    def putconn(self, conn, close = False):
+        """
+        Returns a connection to the pool. Broken connections are closed rather than reused.
+        :param conn: the connection to return.
+        :param close: whether to close the connection instead of keeping it.
+        """
+        try:
+            if conn.closed:
+                close = True
+            elif conn.status != psycopg2.extensions.STATUS_READY:
+                conn.rollback()
+        except psycopg2.Error:
+            close = True
+
+        try:
+            self._pool.putconn(conn, close = close)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                if close:
+                    self._stats["discarded"] += 1
+            self._slots.release()
+
+    def stats(self):
+        """
+        :return: a dict of pool statistics.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_use"] = self._in_use
+
+        stats["min_connections"] = self.min_connections
+        stats["max_connections"] = self.max_connections
+        stats["idle"] = len(self._pool._pool)
+        stats["open"] = stats["idle"] + len(self._pool._used)
+        return stats
+
+    def discard_idle(self):
+        """
+        Closes the idle connections, so that they're reopened when next needed. Used
+        once a connection has dropped, as the idle ones most likely dropped with it.
+        :return: the number of connections closed.
+        """
+        with self._pool._lock:
+            idle = list(self._pool._pool)
+            del self._pool._pool[:]
+        for conn in idle:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+        with self._lock:
+            self._stats["discarded"] += len(idle)
+        return len(idle)
+
+    def closeall(self):
+        if not self._pool.closed:
+            self._pool.closeall()
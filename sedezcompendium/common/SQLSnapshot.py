@@ -0,0 +1,254 @@
+from .SQLObjects import ColumnTable, nRow
+from array import array
+from collections.abc import MutableSequence
+from itertools import accumulate
+import io
+import mmap
+import os
+import pickle
+import struct
+import sys
+
+
+MAGIC = b"SEDZSNAP"
+VERSION = 1
+# magic, version, header length
+_PREFIX = struct.Struct("<8sHQ")
+_HEADER_KEYS = {"table", "columns", "rows", "watermark_column", "watermark"}
+# the types a column's value may have besides those pickle writes natively, as nothing
+# else may be constructed when reading a file
+_SAFE_GLOBALS = {
+    ("builtins", "complex"), ("builtins", "set"), ("builtins", "frozenset"), ("builtins", "bytearray"),
+    ("datetime", "date"), ("datetime", "time"), ("datetime", "datetime"), ("datetime", "timedelta"),
+    ("datetime", "timezone"), ("decimal", "Decimal"), ("uuid", "UUID"), ("uuid", "SafeUUID"),
+    ("psycopg2.tz", "FixedOffsetTimezone"),
+}
+
+
+class _Unpickler(pickle.Unpickler):
+
+    def find_class(self, module, name):
+        if (module, name) not in _SAFE_GLOBALS:
+            raise pickle.UnpicklingError(f"{module}.{name} isn't allowed in a snapshot.")
+        return super().find_class(module, name)
+
+
+def _loads(data, path, what):
+    """
+    Decodes a pickled value, allowing only the types in _SAFE_GLOBALS.
+    :raises ValueError: if the value can't be decoded
+    """
+    try:
+        return _Unpickler(io.BytesIO(data)).load()
+    except Exception as e:
+        raise ValueError(f"{path}: {what} can't be decoded: {e}") from e
+
+
+def _header(data, path):
+    header = _loads(data, path, "the header")
+    if not isinstance(header, dict) or not _HEADER_KEYS <= header.keys():
+        raise ValueError(f"{path}: the header is malformed.")
+    return header
+
+
+def _padding(size):
+    return -size % 8
+
+
+def dump(table, path, watermark_column = None):
+    """
+    Writes a table to a snapshot file: a header describing the table, an offset per
+    row, then each row's values pickled on their own so they can be decoded lazily.
+    The file is written alongside and moved into place, so readers never see half of it.
+    :param table: the Table to write
+    :param path: the file to write to
+    :param watermark_column: a column, such as an updated_at timestamp, whose largest
+    value is recorded so that changes since the snapshot can be fetched.
+    :return: the header that was written
+    """
+    columns = tuple(table.__columns__)
+    rows = list(table)
+    blobs = [pickle.dumps(tuple(getattr(row, column) for column in columns), pickle.HIGHEST_PROTOCOL)
+             for row in rows]
+    watermark = None
+    if watermark_column is not None:
+        watermark = max((getattr(row, watermark_column) for row in rows
+                         if getattr(row, watermark_column) is not None), default = None)
+
+    header = pickle.dumps({
+        "table": table.table_name(),
+        "columns": columns,
+        "rows": len(blobs),
+        "watermark_column": watermark_column,
+        "watermark": watermark,
+    }, pickle.HIGHEST_PROTOCOL)
+    offsets = array("Q", accumulate(map(len, blobs), initial = 0))
+    if sys.byteorder == "big":
+        offsets.byteswap()
+
+    temp = f"{path}.tmp"
+    with open(temp, "wb") as file:
+        file.write(_PREFIX.pack(MAGIC, VERSION, len(header)))
+        file.write(header)
+        file.write(b"\0" * _padding(_PREFIX.size + len(header)))
+        file.write(offsets.tobytes())
+        for blob in blobs:
+            file.write(blob)
+    os.replace(temp, path)
+    return pickle.loads(header)
+
+
+def read_header(path):
+    """
+    :return: the header of a snapshot file, a dict of its table, columns, rows,
+    watermark_column and watermark.
+    """
+    with open(path, "rb") as file:
+        prefix = file.read(_PREFIX.size)
+        _check(prefix, path)
+        magic, version, size = _PREFIX.unpack(prefix)
+        return _header(file.read(size), path)
+
+
+def _check(prefix, path):
+    if len(prefix) < _PREFIX.size or prefix[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a table snapshot.")
+    magic, version, size = _PREFIX.unpack(prefix[:_PREFIX.size])
+    if version != VERSION:
+        raise ValueError(f"{path} is a version {version} snapshot, expected version {VERSION}.")
+
+
+class SnapshotRows(MutableSequence):
+    """
+    The rows of a snapshot file, memory-mapped and decoded one at a time as they're
+    accessed. Changing them decodes every row into a plain list first.
+    """
+
+    def __init__(self, path, row_type, columns):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        _check(self._map[:_PREFIX.size], path)
+        magic, version, size = _PREFIX.unpack_from(self._map)
+        self.header = _header(self._map[_PREFIX.size:_PREFIX.size + size], path)
+        start = _PREFIX.size + size
+        start += _padding(start)
+        count = self.header["rows"]
+        offsets = array("Q")
+        offsets.frombytes(self._map[start:start + (count + 1) * offsets.itemsize])
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        self._offsets = offsets
+        self._data = start + len(offsets) * offsets.itemsize
+        if (len(offsets) != count + 1 or offsets[0] != 0 or self._data + offsets[-1] != len(self._map)
+                or any(a > b for a, b in zip(offsets, offsets[1:]))):
+            self._map.close()
+            raise ValueError(f"{path} is truncated or corrupt.")
+        self._path = path
+        self._row_type = row_type
+        self._columns = columns
+        self._decoded = [None] * count
+        self._rows = None
+
+    def _values(self, index):
+        values = _loads(self._map[self._data + self._offsets[index]:self._data + self._offsets[index + 1]],
+                        self._path, f"row {index}")
+        if not isinstance(values, tuple) or len(values) != len(self._columns):
+            raise ValueError(f"{self._path}: row {index} doesn't match the columns.")
+        return values
+
+    def records(self):
+        """
+        Decodes every row's values, without building rows, and unmaps the file.
+        :return: a list of tuples
+        """
+        records = [self._values(i) for i in range(len(self._decoded))]
+        self._map.close()
+        return records
+
+    def _decode(self, index):
+        values = self._values(index)
+        if self._row_type is nRow:
+            row = nRow(*values, columns = self._columns)
+        else:
+            row = self._row_type(*values)
+        row._loaded = values
+        return row
+
+    def _materialize(self):
+        if self._rows is None:
+            self._rows = [self[i] for i in range(len(self._decoded))]
+            self._decoded = None
+            self._map.close()
+        return self._rows
+
+    def __len__(self):
+        if self._rows is not None:
+            return len(self._rows)
+        return len(self._decoded)
+
+    def __getitem__(self, index):
+        if self._rows is not None:
+            return self._rows[index]
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self._decoded))[index]]
+        row = self._decoded[index]
+        if row is None:
+            if index < 0:
+                index += len(self._decoded)
+            row = self._decoded[index] = self._decode(index)
+        return row
+
+    def __iter__(self):
+        if self._rows is not None:
+            yield from self._rows
+            return
+        decoded = self._decoded
+        for i in range(len(decoded)):
+            row = decoded[i]
+            if row is None:
+                row = decoded[i] = self._decode(i)
+            yield row
+
+    def __eq__(self, other):
+        if isinstance(other, (list, SnapshotRows)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __setitem__(self, index, value):
+        self._materialize()[index] = value
+
+    def __delitem__(self, index):
+        del self._materialize()[index]
+
+    def insert(self, index, value):
+        self._materialize().insert(index, value)
+
+
+def load(path, t_type):
+    """
+    Reads a table from a snapshot file. Rows are decoded as they're accessed, except
+    for a ColumnTable, which is filled in one go. Values are decoded without running
+    any code, allowing only the types a column may hold.
+    :param path: the file written by dump
+    :param t_type: the type of table to load. Subclasses Table.
+    :return: the table
+    :raises ValueError: if the file isn't a snapshot of a table with the same name
+    and columns, or is corrupt. A row that can't be decoded raises it when accessed.
+    """
+    if not isinstance(t_type, type):
+        t_type = type(t_type)
+    row_type = t_type.row_type() if hasattr(t_type, "ROW_TYPE") else nRow
+    header = read_header(path)
+    columns = tuple(header["columns"])
+    expected = tuple(row_type.__columns__) if row_type is not nRow else ()
+    if header["table"] != t_type.table_name() or (expected and expected != columns):
+        raise ValueError(f"{path} holds {header['table']} {columns}, not {t_type.table_name()} {expected}.")
+
+    rows = SnapshotRows(path, row_type, columns)
+    if issubclass(t_type, ColumnTable):
+        return t_type.from_records(rows.records(), columns)
+
+    table = t_type.__new__(t_type)
+    table.__rows__ = rows
+    table.__columns__ = columns
+    return table
@@ -1,2 +1,7 @@
 from .SQLManagement import *
 from .SQLObjects import *
+from .SQLPool import *
+from .SQLCache import *
+from .SQLMetrics import *
+from .SQLNotify import *
+from .AsyncSQLManagement import *
@@ -0,0 +1,71 @@
+import sys
+sys.path.append("C:\\Dev\\SedezCompendium")
+
+import unittest
+from unittest import mock
+import sedezcompendium.common.SQLCache as SQLCache
+import sedezcompendium.common.SQLObjects as SQLObjects
+
+
+class UserRow(SQLObjects.Row):
+    TABLE_NAME = "users"
+    __columns__ = ("id", "name")
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = SQLCache.LRUCache()
+        self.assertIs(cache.get(UserRow, "a"), SQLCache.CACHE_MISS)
+        cache.set(UserRow, "a", 1)
+        self.assertEqual(cache.get(UserRow, "a"), 1)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_lru_eviction(self):
+        cache = SQLCache.LRUCache(max_entries = 2)
+        cache.set(UserRow, "a", 1)
+        cache.set(UserRow, "b", 2)
+        cache.get(UserRow, "a")
+        cache.set(UserRow, "c", 3)
+        self.assertIs(cache.get(UserRow, "b"), SQLCache.CACHE_MISS)
+        self.assertEqual(cache.get(UserRow, "a"), 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_table_limits(self):
+        cache = SQLCache.LRUCache(max_entries = 1, table_limits = {"users": {"max_entries": 3}})
+        for key in "abc":
+            cache.set(UserRow, key, key)
+            cache.set(str, key, key)
+        self.assertEqual(cache.stats()["tables"][UserRow]["entries"], 3)
+        self.assertEqual(cache.stats()["tables"][str]["entries"], 1)
+
+    def test_max_bytes(self):
+        cache = SQLCache.LRUCache(max_bytes = SQLCache.sizeof(UserRow(1, "sedez")) * 2)
+        for i in range(5):
+            cache.set(UserRow, i, UserRow(i, "sedez"))
+        self.assertEqual(cache.stats()["tables"][UserRow]["entries"], 2)
+        self.assertLessEqual(cache.stats()["tables"][UserRow]["bytes"], cache.max_bytes)
+
+    def test_ttl(self):
+        cache = SQLCache.LRUCache(ttl = 10)
+        with mock.patch("time.monotonic", return_value = 0):
+            cache.set(UserRow, "a", 1)
+        with mock.patch("time.monotonic", return_value = 5):
+            self.assertEqual(cache.get(UserRow, "a"), 1)
+        with mock.patch("time.monotonic", return_value = 11):
+            self.assertIs(cache.get(UserRow, "a"), SQLCache.CACHE_MISS)
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_invalidate(self):
+        cache = SQLCache.LRUCache()
+        cache.set(UserRow, "a", 1)
+        cache.set(UserRow, "b", 2)
+        self.assertEqual(cache.invalidate(UserRow, lambda key: key == "a"), 1)
+        self.assertEqual(cache.get(UserRow, "b"), 2)
+        self.assertEqual(cache.invalidate(UserRow), 1)
+        self.assertEqual(cache.stats()["invalidations"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
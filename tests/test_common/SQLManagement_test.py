@@ -0,0 +1,1043 @@
+import sys
+sys.path.append("C:\\Dev\\SedezCompendium")
+
+import asyncio
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+import os
+import pickle
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import psycopg2
+import sedezcompendium.common.AsyncSQLManagement as AsyncSQLManagement
+import sedezcompendium.common.SQLCache as SQLCache
+import sedezcompendium.common.SQLManagement as SQLManagement
+import sedezcompendium.common.SQLMetrics as SQLMetrics
+import sedezcompendium.common.SQLObjects as SQLObjects
+import sedezcompendium.common.SQLPool as SQLPool
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.connection = conn
+        self.description = None
+        self.rowcount = -1
+        self._rows = []
+        self.closed = False
+
+    def execute(self, statement, args = None):
+        self.conn.statements.append((statement, args))
+        result = self.conn.results.pop(0) if self.conn.results else ((), [])
+        if isinstance(result, Exception):
+            if isinstance(result, psycopg2.OperationalError):
+                self.conn.closed = 2
+            raise result
+        columns, rows, *rowcount = result
+        self.description = tuple((c,) for c in columns) or None
+        self._rows = list(rows)
+        self.rowcount = rowcount[0] if rowcount else len(self._rows)
+
+    def mogrify(self, statement, args = None):
+        if isinstance(statement, bytes):
+            statement = statement.decode()
+        if args is None:
+            return statement.encode()
+        return (statement % tuple(repr(arg) for arg in args)).encode()
+
+    def copy_expert(self, statement, file):
+        self.conn.statements.append((statement, file.read()))
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size = None):
+        out, self._rows = self._rows[:size], self._rows[size:]
+        return out
+
+    def fetchall(self):
+        out, self._rows = self._rows, []
+        return out
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, *args, **kwargs):
+        self.autocommit = False
+        self.encoding = "UTF8"
+        self.closed = 0
+        self.status = psycopg2.extensions.STATUS_READY
+        self.info = mock.Mock(transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+        self.statements = []
+        self.results = []
+        self.cursors = []
+
+    def cursor(self, name = None, withhold = False):
+        self.cursors.append((name, withhold, self.autocommit))
+        return FakeCursor(self)
+
+    def set_session(self, autocommit = None):
+        self.autocommit = autocommit
+
+    def rollback(self):
+        self.statements.append(("ROLLBACK", None))
+
+    def commit(self):
+        self.statements.append(("COMMIT", None))
+
+    def close(self):
+        self.closed = 1
+
+
+class UserRow(SQLObjects.Row):
+    TABLE_NAME = "users"
+    __columns__ = ("id", "name")
+
+
+class UserTable(SQLObjects.Table):
+    ROW_TYPE = UserRow
+
+
+def fake_database(**kwargs):
+    return SQLManagement.GenericDatabase("db", "localhost", 5432, "user", "password", "public",
+                                         gen_cursor = True, **kwargs)
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestConnectionPool(unittest.TestCase):
+
+    def test_pool_checkout(self):
+        pool = SQLPool.ConnectionPool(1, 2)
+        first = pool.getconn()
+        second = pool.getconn()
+        self.assertTrue(first.autocommit)
+        self.assertIsNot(first, second)
+        self.assertEqual(pool.stats()["in_use"], 2)
+        pool.putconn(first)
+        pool.putconn(second)
+        stats = pool.stats()
+        self.assertEqual(stats["in_use"], 0)
+        self.assertEqual(stats["peak_in_use"], 2)
+        self.assertEqual(stats["checkouts"], 2)
+
+    def test_pool_waits_for_connection(self):
+        pool = SQLPool.ConnectionPool(1, 1)
+        conn = pool.getconn()
+        threading.Timer(0.05, pool.putconn, (conn,)).start()
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    def test_pool_timeout(self):
+        pool = SQLPool.ConnectionPool(1, 1, timeout = 0.01)
+        pool.getconn()
+        with self.assertRaises(psycopg2.pool.PoolError):
+            pool.getconn()
+        self.assertEqual(pool.stats()["timeouts"], 1)
+
+    def test_pool_keeps_connections_between_bursts(self):
+        with mock.patch("psycopg2.connect", side_effect = FakeConnection) as connect:
+            pool = SQLPool.ConnectionPool(1, 4)
+            for _ in range(3):
+                conns = [pool.getconn() for _ in range(4)]
+                for conn in conns:
+                    pool.putconn(conn)
+        self.assertEqual(connect.call_count, 4)
+        stats = pool.stats()
+        self.assertEqual((stats["idle"], stats["open"], stats["discarded"]), (4, 4, 0))
+
+    def test_pool_discard_idle(self):
+        pool = SQLPool.ConnectionPool(2, 2)
+        conn = pool.getconn()
+        self.assertEqual(pool.discard_idle(), 1)
+        pool.putconn(conn)
+        stats = pool.stats()
+        self.assertEqual((stats["idle"], stats["discarded"]), (1, 1))
+        self.assertIsNot(pool.getconn(), pool.getconn())
+
+    def test_pooled_database(self):
+        db = fake_database(max_connections = 2)
+        with db.connection() as conn:
+            conn.results.append((UserRow.__columns__, [(1, "sedez")]))
+        self.assertEqual(db.get_item(UserRow, id = 1), UserRow(1, "sedez"))
+        self.assertEqual(db.pool_stats()["in_use"], 0)
+        self.assertEqual(db.pool_stats()["checkouts"], 2)
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestCache(unittest.TestCase):
+
+    def test_cache_per_database(self):
+        first = fake_database()
+        second = fake_database()
+        first._conn.results.append((UserRow.__columns__, [(1, "sedez")]))
+        second._conn.results.append((UserRow.__columns__, [(1, "other")]))
+        self.assertEqual(first.get_item(UserRow, id = 1), UserRow(1, "sedez"))
+        self.assertEqual(second.get_item(UserRow, id = 1), UserRow(1, "other"))
+        self.assertEqual(first.get_item(UserRow, id = 1), UserRow(1, "sedez"))
+        self.assertEqual(len(first._conn.statements), 1)
+        self.assertEqual(first.cache_stats()["hits"], 1)
+
+    def test_write_invalidates(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez")]))
+        db.get_item(UserRow, id = 1)
+        db.remove_rows(UserRow, id = 1)
+        self.assertEqual(db.cache_stats()["invalidations"], 1)
+
+    def cached_database(self):
+        db = fake_database()
+        for i in range(1, 4):
+            db._conn.results.append((UserRow.__columns__, [(i, f"user{i}")]))
+            db.get_item(UserRow, id = i)
+        db._conn.results.append((UserRow.__columns__, [(i, f"user{i}") for i in range(1, 4)]))
+        db.get_items(UserTable)
+        return db
+
+    def cached_ids(self, db):
+        return sorted(dict(key[1]).get("id") or 0 for key in db._cache._tables[UserRow])
+
+    def test_update_invalidates_matching_rows(self):
+        db = self.cached_database()
+        db.update_item(UserRow(2, "renamed"), id = 2)
+        self.assertEqual(self.cached_ids(db), [1, 3])
+
+    def test_update_invalidates_new_key(self):
+        db = self.cached_database()
+        db.update_item(UserRow(3, "moved"), id = 2)
+        self.assertEqual(self.cached_ids(db), [1])
+
+    def test_insert_invalidates_matching_rows(self):
+        db = self.cached_database()
+        db.insert_item(UserRow(3, "new"))
+        self.assertEqual(self.cached_ids(db), [1, 2])
+
+    def test_unfiltered_write_flushes(self):
+        db = self.cached_database()
+        db.remove_rows(UserRow)
+        self.assertEqual(self.cached_ids(db), [])
+
+    def test_miss_is_cached(self):
+        db = fake_database()
+        self.assertIsNone(db.get_item(UserRow, id = 4))
+        self.assertEqual(db.get_item(UserRow, default = "missing", id = 4), "missing")
+        self.assertEqual(db.get_item(UserRow, "missing", id = 4), "missing")
+        self.assertEqual(len(db._conn.statements), 1)
+        self.assertEqual(db.cache_stats()["negative_hits"], 2)
+
+    def test_insert_clears_miss(self):
+        db = fake_database()
+        db.get_item(UserRow, id = 4)
+        db.insert_item(UserRow(4, "new"))
+        db._conn.results.append((UserRow.__columns__, [(4, "new")]))
+        self.assertEqual(db.get_item(UserRow, id = 4), UserRow(4, "new"))
+
+    def test_negative_ttl(self):
+        db = fake_database(cache_backend = SQLCache.LRUCache(ttl = 300, negative_ttl = 5))
+        with mock.patch("time.monotonic", return_value = 0):
+            db.get_item(UserRow, id = 4)
+        with mock.patch("time.monotonic", return_value = 6):
+            db.get_item(UserRow, id = 4)
+        self.assertEqual(len(db._conn.statements), 2)
+
+    def test_insert_items_generator(self):
+        db = self.cached_database()
+        db.insert_items(UserRow(i, "new") for i in range(3, 5))
+        self.assertEqual(self.cached_ids(db), [1, 2])
+
+    def test_get_many(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(1, "user1")]))
+        db.get_item(UserRow, id = 1)
+        db._conn.results.append((UserRow.__columns__, [(2, "user2"), (3, "user3")]))
+        rows = db.get_many(UserTable, "id", [1, 2, 3, 4, 2])
+        self.assertEqual(rows, {1: UserRow(1, "user1"), 2: UserRow(2, "user2"), 3: UserRow(3, "user3")})
+        self.assertEqual(db._conn.statements[-1], ("SELECT * FROM public.users WHERE id = ANY(%s);", ([2, 3, 4],)))
+        self.assertEqual(db.get_item(UserRow, id = 3), UserRow(3, "user3"))
+        self.assertIsNone(db.get_item(UserRow, id = 4))
+        self.assertEqual(db.get_many(UserRow, "id", [1, 2, 3, 4]), rows)
+        self.assertEqual(len(db._conn.statements), 2)
+
+    def test_update_items(self):
+        db = self.cached_database()
+        db._conn.results.append((("attname", "format_type"), [("id", "integer"), ("name", "text")]))
+        db._conn.results.append(((), [], 2))
+        db._conn.results.append(((), [], 1))
+        rows = [UserRow(2, "two"), UserRow(3, "three"), UserRow(9, "nine")]
+        self.assertEqual(db.update_items(rows, batch_size = 2), 3)
+        self.assertEqual(db._conn.statements[-2][0],
+                         b"UPDATE public.users AS _t SET name = _v.name FROM (VALUES (2::integer, 'two'::text),"
+                         b"(3::integer, 'three'::text)) AS _v (id, name) WHERE _t.id = _v.id;")
+        self.assertEqual(self.cached_ids(db), [1])
+
+    def test_update_items_key_column_name(self):
+        db = self.cached_database()
+        db._conn.results.append((("attname", "format_type"), [("id", "integer"), ("name", "text")]))
+        db._conn.results.append(((), [], 1))
+        self.assertEqual(db.update_items([UserRow(2, "two")], key_columns = "id"), 1)
+        self.assertEqual(db._conn.statements[-1][0],
+                         b"UPDATE public.users AS _t SET name = _v.name FROM (VALUES (2::integer, 'two'::text)) "
+                         b"AS _v (id, name) WHERE _t.id = _v.id;")
+        self.assertEqual(self.cached_ids(db), [1, 3])
+
+    def test_update_items_last_row_per_key(self):
+        db = self.cached_database()
+        db._conn.results.append((("attname", "format_type"), [("id", "integer"), ("name", "text")]))
+        db._conn.results.append(((), [], 2))
+        rows = [UserRow(2, "old"), UserRow(3, "three"), UserRow(2, "two")]
+        self.assertEqual(db.update_items(rows), 2)
+        self.assertEqual(db._conn.statements[-1][0],
+                         b"UPDATE public.users AS _t SET name = _v.name FROM (VALUES (2::integer, 'two'::text),"
+                         b"(3::integer, 'three'::text)) AS _v (id, name) WHERE _t.id = _v.id;")
+
+    def test_update_items_only_keys(self):
+        db = self.cached_database()
+        statements = len(db._conn.statements)
+        self.assertEqual(db.update_items([UserRow(2, "two")], key_columns = ("id", "name")), 0)
+        self.assertEqual(len(db._conn.statements), statements)
+
+    def test_upsert_writes_back(self):
+        db = self.cached_database()
+        db._conn.results.append((UserRow.__columns__, [(2, "two"), (4, "four")]))
+        rows = db.upsert_items([UserRow(2, "old"), UserRow(4, "four"), UserRow(2, "two")])
+        self.assertEqual(rows, [UserRow(2, "two"), UserRow(4, "four")])
+        self.assertEqual(db._conn.statements[-1][0],
+                         b"INSERT INTO public.users (id,name) VALUES (2,'two'),(4,'four') "
+                         b"ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name RETURNING id,name;")
+        self.assertEqual(self.cached_ids(db), [1, 2, 3, 4])
+        statements = len(db._conn.statements)
+        self.assertEqual(db.get_item(UserRow, id = 2), UserRow(2, "two"))
+        self.assertEqual(db.get_item(UserRow, id = 4), UserRow(4, "four"))
+        self.assertEqual(len(db._conn.statements), statements)
+
+    def test_upsert_item(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(5, "five")]))
+        self.assertEqual(db.upsert_item(UserRow(5, "five")), UserRow(5, "five"))
+        self.assertEqual(db.get_item(UserRow, id = 5), UserRow(5, "five"))
+        self.assertEqual(len(db._conn.statements), 1)
+
+    def test_upsert_key_column_name(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(5, "five")]))
+        self.assertEqual(db.upsert_items([UserRow(5, "five")], key_columns = "id"), [UserRow(5, "five")])
+        self.assertEqual(db._conn.statements[-1][0],
+                         b"INSERT INTO public.users (id,name) VALUES (5,'five') "
+                         b"ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name RETURNING id,name;")
+        self.assertEqual(db.get_item(UserRow, id = 5), UserRow(5, "five"))
+        self.assertEqual(len(db._conn.statements), 1)
+
+    def test_concurrent_misses_share_query(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez")]))
+        execute = FakeCursor.execute
+
+        def slow_execute(cursor, statement, args = None):
+            time.sleep(0.05)
+            execute(cursor, statement, args)
+
+        results = []
+        with mock.patch.object(FakeCursor, "execute", slow_execute):
+            threads = [threading.Thread(target = lambda: results.append(db.get_item(UserRow, id = 1)))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results, [UserRow(1, "sedez")] * 8)
+        self.assertEqual(len(db._conn.statements), 1)
+        self.assertEqual(db._flights, {})
+
+    def test_no_wait_while_holding_connection(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez"), (2, "compendium")]))
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez")]))
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez")]))
+        results = []
+        leader = threading.Thread(target = lambda: results.append(db.get_item(UserRow, id = 1)))
+
+        def iterate():
+            for i, row in enumerate(db.iter_items(UserRow, batch_size = 1)):
+                if i == 0:
+                    # the other thread misses first, and waits on the connection this one holds
+                    leader.start()
+                    while not db._flights:
+                        time.sleep(0.001)
+                results.append(db.get_item(UserRow, id = 1))
+
+        iterating = threading.Thread(target = iterate)
+        with mock.patch.object(SQLManagement, "_FLIGHT_TIMEOUT", 10):
+            iterating.start()
+            iterating.join(2)
+            self.assertFalse(iterating.is_alive())
+            leader.join(2)
+        self.assertEqual(results, [UserRow(1, "sedez")] * 3)
+
+    def test_write_during_miss_isnt_cached(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez")]))
+        execute = FakeCursor.execute
+
+        def racing_execute(cursor, statement, args = None):
+            execute(cursor, statement, args)
+            db._invalidate(UserRow, [{"id": 1}])
+
+        with mock.patch.object(FakeCursor, "execute", racing_execute):
+            self.assertEqual(db.get_item(UserRow, id = 1), UserRow(1, "sedez"))
+        db.get_item(UserRow, id = 1)
+        self.assertEqual(len(db._conn.statements), 2)
+
+    def test_drop_table_by_name_flushes(self):
+        db = self.cached_database()
+        db.drop_table("users")
+        self.assertEqual(self.cached_ids(db), [])
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestAsyncGenericDatabase(unittest.IsolatedAsyncioTestCase):
+
+    async def test_query_does_not_block_loop(self):
+        db = fake_database(max_connections = 2)
+        adb = AsyncSQLManagement.AsyncGenericDatabase(db)
+
+        def slow_get_item(t_type, default = None, **kwargs):
+            time.sleep(0.1)
+            return UserRow(kwargs["id"], "sedez")
+
+        ticks = []
+
+        async def heartbeat():
+            for _ in range(5):
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+
+        with mock.patch.object(db, "get_item", slow_get_item):
+            row, _ = await asyncio.gather(adb.get_item(UserRow, id = 1), heartbeat())
+        self.assertEqual(row, UserRow(1, "sedez"))
+        self.assertEqual(len(ticks), 5)
+        self.assertLess(ticks[-1] - ticks[0], 0.09)
+        await adb.close()
+
+    async def test_identical_reads_coalesce(self):
+        db = fake_database(max_connections = 2)
+        adb = AsyncSQLManagement.AsyncGenericDatabase(db)
+        calls = []
+
+        def slow_get_item(t_type, default = None, **kwargs):
+            calls.append(kwargs)
+            time.sleep(0.05)
+            return default
+
+        with mock.patch.object(db, "get_item", slow_get_item):
+            results = await asyncio.gather(adb.get_item(UserRow, id = 1), adb.get_item(UserRow, "missing", id = 1),
+                                           adb.get_item(UserRow, id = 2))
+        self.assertEqual(results, [None, "missing", None])
+        self.assertEqual(calls, [{"id": 1}, {"id": 2}])
+        self.assertEqual(adb._inflight, {})
+        await adb.close()
+
+    async def test_iter_items(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(i, f"user{i}") for i in range(5)]))
+        adb = AsyncSQLManagement.AsyncGenericDatabase(db)
+        rows = [row async for row in adb.iter_items(UserRow, batch_size = 2)]
+        self.assertEqual(rows, [UserRow(i, f"user{i}") for i in range(5)])
+        await adb.close()
+
+    async def test_queries_inside_iteration(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez"), (2, "compendium")]))
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez")]))
+        db._conn.results.append((UserRow.__columns__, [(2, "compendium")]))
+        adb = AsyncSQLManagement.AsyncGenericDatabase(db, max_workers = 4)
+
+        async def iterate():
+            return [(row, await adb.get_item(UserRow, id = row.id))
+                    async for row in adb.iter_items(UserRow, batch_size = 1)]
+
+        pairs = await asyncio.wait_for(iterate(), 2)
+        self.assertEqual([row for row, item in pairs], [item for row, item in pairs])
+        await adb.close()
+
+    async def test_thread_bound_methods_are_refused(self):
+        adb = AsyncSQLManagement.AsyncGenericDatabase(fake_database())
+        with self.assertRaises(AttributeError):
+            adb.transaction
+        await adb.close()
+
+    async def test_other_methods_are_awaitable(self):
+        db = fake_database(max_connections = 2)
+        adb = AsyncSQLManagement.AsyncGenericDatabase(db)
+        self.assertEqual(await adb.pool_stats(), db.pool_stats())
+        await adb.close()
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestBulkInsert(unittest.TestCase):
+
+    def test_insert_items_batches(self):
+        db = fake_database()
+        db.insert_items(UserTable(*[UserRow(i, f"user{i}") for i in range(5)]), batch_size = 2)
+        statements = [statement for statement, args in db._conn.statements]
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(statements[0], b"INSERT INTO public.users (id,name) VALUES (0,'user0'),(1,'user1')")
+
+    def test_insert_items_copy(self):
+        db = fake_database()
+        db.insert_items([UserRow(1, "tab\there"), UserRow(2, None)], method = "copy")
+        self.assertEqual(db._conn.statements, [("COPY public.users (id,name) FROM STDIN", "1\ttab\\there\n2\t\\N\n")])
+
+    def test_create_table_seeds(self):
+        db = fake_database()
+        db.create_table(UserTable(UserRow(1, "sedez"), UserRow(2, "east")), id = "integer", name = "text")
+        self.assertEqual(len(db._conn.statements), 2)
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestTemplates(unittest.TestCase):
+
+    def test_filters_are_parameters(self):
+        db = fake_database()
+        db.get_item(UserRow, id = 1, name = "o'brien")
+        db.get_item(UserRow, id = 2, name = None)
+        self.assertEqual(db._conn.statements, [
+            ("SELECT * FROM public.users WHERE id = %s AND name = %s LIMIT 1;", (1, "o'brien")),
+            ("SELECT * FROM public.users WHERE id = %s AND name IS NULL LIMIT 1;", (2,)),
+        ])
+
+    def test_writes_are_parameters(self):
+        db = fake_database()
+        db.update_item(UserRow(1, "o'brien"), id = 1)
+        db.insert_item(UserRow(2, "east"))
+        db.remove_rows(UserRow, limit = 5, name = "east")
+        self.assertEqual(db._conn.statements, [
+            ("UPDATE public.users SET id = %s, name = %s WHERE id = %s;", (1, "o'brien", 1)),
+            ("INSERT INTO public.users (id,name) VALUES (%s,%s);", (2, "east")),
+            ("DELETE FROM public.users WHERE ctid IN (SELECT ctid FROM public.users WHERE name = %s LIMIT %s OFFSET %s);",
+             ("east", 5, 0)),
+        ])
+
+    def test_templates_are_cached(self):
+        db = fake_database()
+        first = db.template("select", "users", filters = (("id", False),))
+        self.assertIs(db.template("select", "users", filters = (("id", False),)), first)
+
+    def test_prepare(self):
+        db = fake_database(prepare = True)
+        db.get_item(UserRow, id = 1)
+        db.get_item(UserRow, id = 2)
+        statements = [statement for statement, args in db._conn.statements]
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(statements[0].startswith("PREPARE sedez_"))
+        self.assertTrue(statements[0].endswith("AS SELECT * FROM public.users WHERE id = $1 LIMIT 1;"))
+        self.assertEqual(statements[1], statements[2])
+        self.assertTrue(statements[1].startswith("EXECUTE sedez_"))
+        self.assertEqual(db._conn.statements[2][1], (2,))
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestTransactions(unittest.TestCase):
+
+    def cached_database(self, **kwargs):
+        db = fake_database(**kwargs)
+        with db.connection() as conn:
+            conn.results.extend((UserRow.__columns__, [(i, f"user{i}")]) for i in range(1, 3))
+        for i in range(1, 3):
+            db.get_item(UserRow, id = i)
+        return db
+
+    def test_invalidates_on_commit(self):
+        db = self.cached_database()
+        with db.transaction():
+            db.update_item(UserRow(1, "renamed"), id = 1)
+            db.remove_rows(UserRow, id = 2)
+            self.assertEqual(len(db._cache._tables[UserRow]), 2)
+            self.assertFalse(db._conn.autocommit)
+        self.assertEqual(len(db._cache._tables[UserRow]), 0)
+        self.assertEqual(db._conn.statements[-1], ("COMMIT", None))
+        self.assertTrue(db._conn.autocommit)
+
+    def test_rollback_keeps_cache(self):
+        db = self.cached_database()
+        with self.assertRaises(KeyError):
+            with db.transaction():
+                db.update_item(UserRow(1, "renamed"), id = 1)
+                raise KeyError()
+        self.assertEqual(len(db._cache._tables[UserRow]), 2)
+        self.assertEqual(db._conn.statements[-1], ("ROLLBACK", None))
+
+    def test_batch_sends_one_statement(self):
+        db = self.cached_database(max_connections = 1)
+        with db.batch():
+            db.insert_item(UserRow(3, "three"))
+            db.update_item(UserRow(1, "o'brien"), id = 1)
+            db.remove_rows(UserRow, id = 2)
+        with db.connection() as conn:
+            statements = conn.statements[-2:]
+        self.assertEqual(statements[0][0],
+                         b"INSERT INTO public.users (id,name) VALUES (3,'three');\n"
+                         b"UPDATE public.users SET id = 1, name = \"o'brien\" WHERE id = 1;\n"
+                         b"DELETE FROM public.users WHERE id = 2;")
+        self.assertEqual(statements[1], ("COMMIT", None))
+        self.assertEqual(len(db._cache._tables[UserRow]), 0)
+
+    def test_batch_flushes_before_other_statements(self):
+        db = fake_database()
+        db._conn.results.append((("attname", "format_type"), [("id", "integer"), ("name", "text")]))
+        with db.batch():
+            db.insert_item(UserRow(3, "three"))
+            db.update_items([UserRow(3, "x")])
+        statements = [statement for statement, args in db._conn.statements]
+        self.assertEqual(statements[0], b"INSERT INTO public.users (id,name) VALUES (3,'three');")
+        self.assertTrue(statements[1].lstrip().startswith("SELECT attname"))
+        self.assertTrue(statements[2].startswith(b"UPDATE public.users AS _t"))
+
+    def test_nested_batch_restores_queue(self):
+        db = fake_database()
+        with db.transaction():
+            with db.batch():
+                db.insert_item(UserRow(3, "three"))
+            self.assertEqual(db._conn.statements[-1][0], b"INSERT INTO public.users (id,name) VALUES (3,'three');")
+            db.insert_item(UserRow(4, "four"))
+            self.assertEqual(db._conn.statements[-1],
+                             ("INSERT INTO public.users (id,name) VALUES (%s,%s);", (4, "four")))
+
+    def test_reads_bypass_cache(self):
+        db = self.cached_database()
+        with db.transaction():
+            db._conn.results.append((UserRow.__columns__, [(1, "uncommitted")]))
+            self.assertEqual(db.get_item(UserRow, id = 1), UserRow(1, "uncommitted"))
+        self.assertEqual(db.get_item(UserRow, id = 1), UserRow(1, "user1"))
+
+
+    def test_ddl_deallocates_prepared(self):
+        db = fake_database(prepare = True)
+        db.get_item(UserRow, id = 1)
+        db.remove_column("users", "name")
+        db.get_item(UserRow, id = 2)
+        statements = [statement for statement, args in db._conn.statements]
+        self.assertEqual(statements[2], "ALTER TABLE public.users DROP COLUMN name")
+        self.assertTrue(statements[3].startswith("DEALLOCATE sedez_"))
+        self.assertTrue(statements[4].startswith("PREPARE sedez_"))
+        self.assertTrue(statements[5].startswith("EXECUTE sedez_"))
+
+
+    def test_sync_table(self):
+        db = self.cached_database()
+        with db.connection() as conn:
+            conn.results.append((UserRow.__columns__, [(1, "user1"), (2, "user2"), (3, "user3")]))
+            conn.results.append((("attname", "format_type"), [("id", "integer"), ("name", "text")]))
+        table = UserTable(UserRow(1, "user1"), UserRow(2, "renamed"), UserRow(4, "four"))
+        changes = db.sync_table(table)
+        self.assertEqual(changes, ([UserRow(4, "four")], [UserRow(2, "renamed")], [UserRow(3, "user3")]))
+        statements = [statement for statement, args in db._conn.statements[-4:]]
+        self.assertEqual(statements[:3], [
+            b"DELETE FROM public.users AS _t USING (VALUES (3::integer)) AS _v (id) WHERE _t.id = _v.id;",
+            b"INSERT INTO public.users (id,name) VALUES (4,'four')",
+            b"UPDATE public.users AS _t SET name = _v.name FROM (VALUES (2::integer, 'renamed'::text)) "
+            b"AS _v (id, name) WHERE _t.id = _v.id;",
+        ])
+        self.assertEqual(statements[-1], "COMMIT")
+        self.assertEqual(list(db._cache._tables[UserRow]), [("get_item", frozenset({("id", 1)}))])
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestStreaming(unittest.TestCase):
+
+    def test_iter_items(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(i, f"user{i}") for i in range(5)]))
+        rows = db.iter_items(UserRow, batch_size = 2, name = "sedez")
+        self.assertEqual(next(rows), UserRow(0, "user0"))
+        self.assertEqual(list(rows), [UserRow(i, f"user{i}") for i in range(1, 5)])
+        self.assertEqual(db._conn.statements[0], ("SELECT * FROM public.users WHERE name = %s;", ("sedez",)))
+        name, withhold, autocommit = db._conn.cursors[-1]
+        self.assertTrue(name and not withhold and not autocommit)
+        self.assertEqual(db._conn.statements[-1], ("COMMIT", None))
+        self.assertTrue(db._conn.autocommit)
+
+    def test_iter_table_pooled(self):
+        db = fake_database(max_connections = 1)
+        with db.connection() as conn:
+            conn.results.append((UserRow.__columns__, [(i, f"user{i}") for i in range(5)]))
+        chunks = list(db.iter_table(UserTable, batch_size = 2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertIsInstance(chunks[0], UserTable)
+        name, withhold, autocommit = conn.cursors[-1]
+        self.assertTrue(name and not withhold and not autocommit)
+        self.assertTrue(conn.autocommit)
+
+    def test_load_column_table(self):
+        class UserColumns(SQLObjects.ColumnTable):
+            ROW_TYPE = UserRow
+
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez"), (2, "compendium")]))
+        table = db.load_table(UserColumns)
+        self.assertIsInstance(table, UserColumns)
+        self.assertEqual(table.sum("id"), 3)
+        self.assertEqual(table[1], UserRow(2, "compendium"))
+
+    def test_get_items_rows(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez"), (2, "compendium")]))
+        rows = db.get_items(UserRow)
+        self.assertEqual(rows, [UserRow(1, "sedez"), UserRow(2, "compendium")])
+        self.assertEqual(rows[0]._loaded, (1, "sedez"))
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestPages(unittest.TestCase):
+
+    def test_first_page(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(1, "a"), (2, "b"), (3, "c")]))
+        page, token = db.get_page(UserTable, order_by = "name", limit = 2)
+        self.assertIsInstance(page, UserTable)
+        self.assertEqual(list(page), [UserRow(1, "a"), UserRow(2, "b")])
+        self.assertIsNotNone(token)
+        self.assertEqual(db._conn.statements[0],
+                         ("SELECT * FROM public.users ORDER BY name, id LIMIT %s;", (3,)))
+
+    def test_page_after_token(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(1, "a"), (2, "b"), (3, "c")]))
+        page, token = db.get_page(UserTable, order_by = "name", limit = 2)
+        db._conn.results.append((UserRow.__columns__, [(3, "c")]))
+        page, last = db.get_page(UserTable, order_by = "name", after = token, limit = 2, id = 3)
+        self.assertEqual(list(page), [UserRow(3, "c")])
+        self.assertIsNone(last)
+        self.assertEqual(db._conn.statements[-1],
+                         ("SELECT * FROM public.users WHERE id = %s AND (name, id) > (%s, %s) "
+                          "ORDER BY name, id LIMIT %s;", (3, "b", 2, 3)))
+
+    def test_descending(self):
+        db = fake_database()
+        token = SQLManagement._page_token((5,))
+        db._conn.results.append((UserRow.__columns__, [(4, "d")]))
+        page, last = db.get_page(UserRow, order_by = "id", after = token, descending = True)
+        self.assertEqual(page, [UserRow(4, "d")])
+        self.assertEqual(db._conn.statements[0],
+                         ("SELECT * FROM public.users WHERE (id) < (%s) ORDER BY id DESC LIMIT %s;", (5, 21)))
+
+    def test_pages_are_cached(self):
+        db = fake_database()
+        db._conn.results.append((UserRow.__columns__, [(1, "a")]))
+        first = db.get_page(UserTable, order_by = "name")
+        self.assertIs(db.get_page(UserTable, order_by = "name"), first)
+        self.assertEqual(len(db._conn.statements), 1)
+        db.insert_item(UserRow(2, "b"))
+        db.get_page(UserTable, order_by = "name")
+        self.assertEqual(len(db._conn.statements), 3)
+
+    def test_token_values(self):
+        values = (datetime(2024, 1, 2, 3, 4, 5, tzinfo = timezone.utc), Decimal("1.50"), "sedez", 7)
+        self.assertEqual(SQLManagement._page_values(SQLManagement._page_token(values), 4), values)
+        with self.assertRaises(ValueError):
+            SQLManagement._page_values(SQLManagement._page_token(values), 2)
+        with self.assertRaises(ValueError):
+            SQLManagement._page_values("not a token", 1)
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestDirtyTracking(unittest.TestCase):
+
+    def loaded_row(self, db):
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez")]))
+        return db.get_item(UserRow, id = 1)
+
+    def test_sets_dirty_columns(self):
+        db = fake_database()
+        row = self.loaded_row(db)
+        self.assertEqual(row.dirty_columns(), ())
+        row.name = "compendium"
+        self.assertEqual(row.dirty_columns(), ("name",))
+        self.assertTrue(db.update_item(row, id = 1))
+        self.assertEqual(db._conn.statements[-1], ("UPDATE public.users SET name = %s WHERE id = %s;", ("compendium", 1)))
+        self.assertEqual(row.dirty_columns(), ())
+
+    def test_skips_clean_rows(self):
+        db = fake_database()
+        row = self.loaded_row(db)
+        statements = len(db._conn.statements)
+        self.assertFalse(db.save(row))
+        self.assertEqual(len(db._conn.statements), statements)
+
+    def test_save_matches_loaded_key(self):
+        db = fake_database()
+        row = self.loaded_row(db)
+        row.id = 2
+        self.assertTrue(db.save(row))
+        self.assertEqual(db._conn.statements[-1], ("UPDATE public.users SET id = %s WHERE id = %s;", (2, 1)))
+        self.assertEqual(row.dirty_columns(), ())
+
+    def test_rollback_keeps_dirty(self):
+        db = fake_database()
+        row = self.loaded_row(db)
+        row.name = "compendium"
+        with self.assertRaises(KeyError):
+            with db.transaction():
+                db.save(row)
+                raise KeyError()
+        self.assertEqual(row.dirty_columns(), ("name",))
+
+    def test_failed_write_keeps_dirty(self):
+        db = fake_database()
+        row = self.loaded_row(db)
+        row.name = "compendium"
+        with mock.patch.object(FakeCursor, "execute", side_effect = psycopg2.Error("failed")):
+            self.assertFalse(db.save(row))
+        self.assertEqual(row.dirty_columns(), ("name",))
+
+    def test_unloaded_rows_write_every_column(self):
+        db = fake_database()
+        row = UserRow(1, "sedez")
+        self.assertIsNone(row.dirty_columns())
+        db.save(row)
+        self.assertEqual(db._conn.statements[-1], ("UPDATE public.users SET id = %s, name = %s WHERE id = %s;", (1, "sedez", 1)))
+        self.assertEqual(row.dirty_columns(), ())
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestSnapshots(unittest.TestCase):
+
+    class StampedRow(SQLObjects.Row):
+        TABLE_NAME = "stamped"
+        __columns__ = ("id", "name", "updated")
+
+    class StampedTable(SQLObjects.Table):
+        pass
+
+    def setUp(self):
+        self.StampedTable.ROW_TYPE = self.StampedRow
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "stamped.snapshot")
+        self.rows = [(i, f"user{i}", i) for i in range(3)]
+
+    def test_cold_start_writes_snapshot(self):
+        db = fake_database()
+        db._conn.results.append((self.StampedRow.__columns__, self.rows))
+        table = db.load_snapshot(self.StampedTable, self.path, "updated")
+        self.assertEqual(len(table), 3)
+        self.assertEqual(self.StampedTable.load(self.path), table)
+
+    def test_fetches_changes_since(self):
+        self.StampedTable(*(self.StampedRow(*row) for row in self.rows)).dump(self.path, "updated")
+        db = fake_database()
+        db._conn.results.append((self.StampedRow.__columns__, [(2, "user2", 2), (1, "renamed", 3), (3, "new", 4)]))
+        db._conn.results.append((("count",), [(4,)]))
+        table = db.load_snapshot(self.StampedTable, self.path, "updated")
+        self.assertEqual(db._conn.statements[0], ("SELECT * FROM public.stamped WHERE updated >= %s;", (2,)))
+        self.assertEqual([(row.id, row.name) for row in table], [(0, "user0"), (1, "renamed"), (2, "user2"), (3, "new")])
+        self.assertEqual(len(db._conn.statements), 2)
+        self.assertEqual(self.StampedTable.load(self.path), table)
+
+    def test_count_mismatch_reloads(self):
+        self.StampedTable(*(self.StampedRow(*row) for row in self.rows)).dump(self.path)
+        db = fake_database()
+        db._conn.results.append((("count",), [(2,)]))
+        db._conn.results.append((self.StampedRow.__columns__, self.rows[:2]))
+        table = db.load_snapshot(self.StampedTable, self.path)
+        self.assertEqual(len(table), 2)
+        self.assertEqual(db._conn.statements[-1], ("SELECT * FROM public.stamped;", None))
+
+    def test_corrupt_row_reloads(self):
+        self.StampedTable(*(self.StampedRow(*row) for row in self.rows)).dump(self.path)
+        with open(self.path, "rb") as file:
+            data = file.read()
+        blob = pickle.dumps(self.rows[-1], pickle.HIGHEST_PROTOCOL)
+        with open(self.path, "wb") as file:
+            file.write(data.replace(blob, b"\xff" * len(blob)))
+        db = fake_database()
+        db._conn.results.append((self.StampedRow.__columns__, self.rows))
+        table = db.load_snapshot(self.StampedTable, self.path)
+        self.assertEqual(db._conn.statements, [("SELECT * FROM public.stamped;", None)])
+        self.assertEqual([row.id for row in table], [0, 1, 2])
+        self.assertEqual(self.StampedTable.load(self.path), table)
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestCoherence(unittest.TestCase):
+
+    def cached_database(self):
+        db = fake_database()
+        db._notify_channel = "sedez"
+        for i in (1, 2):
+            db._conn.results.append((UserRow.__columns__, [(i, "sedez")]))
+            db.get_item(UserRow, id = i)
+        return db
+
+    def entries(self, db):
+        return sum(table["entries"] for table in db.cache_stats()["tables"].values())
+
+    def test_write_publishes(self):
+        db = self.cached_database()
+        db.update_item(UserRow(1, "compendium"), id = 1)
+        statement, (channel, payload) = db._conn.statements[-1]
+        self.assertEqual(statement, "SELECT pg_notify(%s, %s);")
+        self.assertEqual(channel, "sedez")
+        self.assertEqual(json.loads(payload), {"origin": db._origin, "table": "users",
+                                              "rows": [{"id": 1}, {"id": 1, "name": "compendium"}]})
+
+    def test_publishes_on_commit(self):
+        db = self.cached_database()
+        with db.transaction():
+            db.insert_item(UserRow(3, "sedez"))
+            self.assertNotIn("pg_notify", str(db._conn.statements))
+        self.assertEqual(db._conn.statements[-1][0], "SELECT pg_notify(%s, %s);")
+
+    def test_remote_evicts_matching(self):
+        db = self.cached_database()
+        payload = SQLManagement._notify_payload("other", "users", [{"id": 1}])
+        db._notified(payload)
+        self.assertEqual(self.entries(db), 1)
+        self.assertNotIn("pg_notify", str(db._conn.statements))
+
+    def test_own_notifications_ignored(self):
+        db = self.cached_database()
+        db._notified(SQLManagement._notify_payload(db._origin, "users", None))
+        self.assertEqual(self.entries(db), 2)
+
+    def test_large_payload_flushes_table(self):
+        db = self.cached_database()
+        rows = [{"id": i, "name": "x" * 100} for i in range(100)]
+        self.assertIsNone(json.loads(SQLManagement._notify_payload("other", "users", rows))["rows"])
+        db._notified(SQLManagement._notify_payload("other", "users", [{"id": [1, 2]}]))
+        self.assertEqual(self.entries(db), 0)
+
+    def test_listen(self):
+        with mock.patch.object(SQLManagement, "NotifyListener") as listener:
+            db = fake_database(notify_channel = "sedez")
+        args, kwargs = listener.call_args
+        self.assertEqual(args, ("sedez", db._notified, db.clear_cache))
+        listener.return_value.start.assert_called_once_with()
+        db.unlisten()
+        listener.return_value.stop.assert_called_once_with()
+        self.assertIsNone(db._notify_channel)
+
+
+def dropped():
+    return psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestReconnect(unittest.TestCase):
+
+    def test_read_retries_after_drop(self):
+        metrics = SQLMetrics.QueryMetrics()
+        db = fake_database(metrics = metrics)
+        db._conn.results.append(dropped())
+        new = FakeConnection()
+        new.results.append((UserRow.__columns__, [(1, "sedez")]))
+        with mock.patch("psycopg2.connect", return_value = new), self.assertLogs(level = "WARNING"):
+            self.assertEqual(db.get_item(UserRow, id = 1), UserRow(1, "sedez"))
+        self.assertIs(db._conn, new)
+        stats = db.connection_stats()
+        self.assertEqual((stats["disconnects"], stats["reconnects"], stats["retries"]), (1, 1, 1))
+        self.assertTrue(stats["connected"])
+        self.assertIsNotNone(stats["last_disconnect"])
+        self.assertEqual(metrics.stats()["connections"], {"disconnect": 1, "retry": 1, "reconnect": 1})
+
+    def test_write_reconnects_without_rerun(self):
+        db = fake_database()
+        db._conn.results.append(dropped())
+        new = FakeConnection()
+        with mock.patch("psycopg2.connect", return_value = new), self.assertLogs(level = "ERROR"):
+            self.assertFalse(db.insert_item(UserRow(1, "sedez")))
+        self.assertIs(db._conn, new)
+        self.assertEqual(new.statements, [])
+
+    def test_retry_budget(self):
+        db = fake_database(read_retries = 2, retry_delay = 0)
+
+        def failing(*args, **kwargs):
+            conn = FakeConnection()
+            conn.results.append(dropped())
+            return conn
+
+        db._conn.results.append(dropped())
+        with mock.patch("psycopg2.connect", side_effect = failing) as connect, self.assertLogs(level = "ERROR"):
+            with self.assertRaises(psycopg2.OperationalError):
+                db.get_item(UserRow, id = 1)
+        self.assertEqual(connect.call_count, 2)
+        self.assertEqual(db.connection_stats()["retries"], 2)
+
+    def test_statement_errors_are_not_retried(self):
+        db = fake_database()
+        conn = db._conn
+        conn.results.append(psycopg2.ProgrammingError("relation \"users\" does not exist"))
+        with self.assertLogs(level = "ERROR"):
+            self.assertIsNone(db.get_item(UserRow, id = 1))
+        self.assertIs(db._conn, conn)
+        self.assertEqual(db.connection_stats()["disconnects"], 0)
+
+    def test_reconnects_before_use(self):
+        db = fake_database()
+        db._conn.closed = 1
+        self.assertFalse(db.is_connected())
+        new = FakeConnection()
+        new.results.append((("?column?",), [(1,)]))
+        with mock.patch("psycopg2.connect", return_value = new):
+            self.assertTrue(db.ping())
+        self.assertEqual(new.statements, [("SELECT 1;", None)])
+        self.assertTrue(db.is_connected())
+        self.assertEqual(db.connection_stats()["reconnects"], 1)
+
+    def test_unconnected_database(self):
+        db = SQLManagement.GenericDatabase("db", "localhost", 5432, "user", "password", "public")
+        self.assertFalse(db.is_connected())
+        with self.assertLogs(level = "ERROR"):
+            self.assertFalse(db.ping())
+
+    def test_pool_discards_idle_after_drop(self):
+        db = fake_database(min_connections = 2, max_connections = 2)
+        with db.connection() as conn:
+            conn.results.append(dropped())
+        with mock.patch("psycopg2.connect", side_effect = FakeConnection), self.assertLogs(level = "WARNING"):
+            db.get_item(UserRow, id = 1)
+        self.assertEqual(db.pool_stats()["discarded"], 2)
+        self.assertEqual(db.connection_stats()["retries"], 1)
+
+
+@mock.patch("psycopg2.connect", FakeConnection)
+class TestMetrics(unittest.TestCase):
+
+    def test_query_and_cache_metrics(self):
+        db = fake_database(metrics = SQLMetrics.QueryMetrics())
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez"), (2, "compendium")]))
+        self.assertEqual(len(db.get_items(UserTable, name = "sedez")), 2)
+        db.get_items(UserTable, name = "sedez")
+        db.insert_item(UserRow(3, "sedez"))
+        stats = db.query_stats()
+        query = stats["queries"][("get_items", "users")]
+        self.assertEqual((query["count"], query["rows"], sum(query["histogram"])), (1, 2, 1))
+        self.assertGreater(query["bytes"], 0)
+        self.assertEqual(stats["cache"][("get_items", "users")], {"hits": 1, "misses": 1})
+        self.assertEqual(stats["invalidations"], {"users": 1})
+        self.assertIn(("insert_item", "users"), stats["queries"])
+
+    def test_slow_query_log(self):
+        db = fake_database(slow_query = 0)
+        db._conn.results.append((UserRow.__columns__, [(1, "sedez")]))
+        with self.assertLogs("sedezcompendium.common.SQLManagement", "WARNING") as logs:
+            db.get_item(UserRow, id = 1)
+        self.assertIn("get_item on users", logs.output[0])
+        self.assertIn("SELECT * FROM public.users WHERE id = %s LIMIT 1;", logs.output[0])
+
+    def test_histogram_buckets(self):
+        metrics = SQLMetrics.QueryMetrics(buckets = (0.1, 1.0))
+        for seconds in (0.05, 0.5, 0.7, 2.0):
+            metrics.query("get_item", "users", seconds, 1, 0)
+        query = metrics.stats()["queries"][("get_item", "users")]
+        self.assertEqual(query["histogram"], [1, 2, 1])
+        self.assertEqual(query["max_seconds"], 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import sys
+sys.path.append("C:\\Dev\\SedezCompendium")
+
+import os
+import threading
+import unittest
+from collections import namedtuple
+from unittest import mock
+import psycopg2
+import sedezcompendium.common.SQLNotify as SQLNotify
+
+
+Notify = namedtuple("Notify", ("pid", "channel", "payload"))
+
+
+class PipeConnection:
+    """
+    A connection whose notifications arrive through a pipe, so that select() sees them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._read, self._write = os.pipe()
+        self.autocommit = False
+        self.statements = []
+        self.notifies = []
+        self._pending = []
+        self.closed = 0
+
+    def fileno(self):
+        return self._read
+
+    def cursor(self):
+        return mock.Mock(execute = lambda statement: self.statements.append(statement))
+
+    def send(self, channel, payload):
+        self._pending.append(Notify(1, channel, payload))
+        os.write(self._write, b"x")
+
+    def poll(self):
+        os.read(self._read, 1)
+        self.notifies.append(self._pending.pop(0))
+
+    def close(self):
+        if not self.closed:
+            self.closed = 1
+            os.close(self._read)
+            os.close(self._write)
+
+
+class TestNotifyListener(unittest.TestCase):
+
+    def listener(self, connections, **kwargs):
+        received = []
+        done = threading.Event()
+
+        def callback(payload):
+            received.append(payload)
+            done.set()
+
+        connect = mock.Mock(side_effect = connections)
+        patch = mock.patch("psycopg2.connect", connect)
+        patch.start()
+        self.addCleanup(patch.stop)
+        listener = SQLNotify.NotifyListener("sedez", callback, poll_interval = 0.01, retry = 0.01, **kwargs)
+        self.addCleanup(listener.stop)
+        return listener, received, done, connect
+
+    def test_callback(self):
+        conn = PipeConnection()
+        listener, received, done, connect = self.listener([conn])
+        listener.start()
+        conn.send("other", "ignored")
+        conn.send("sedez", "payload")
+        self.assertTrue(done.wait(1))
+        self.assertEqual(received, ["payload"])
+        self.assertEqual(conn.statements, ["LISTEN sedez;"])
+        self.assertTrue(conn.autocommit)
+        listener.stop()
+        self.assertFalse(listener.running)
+        self.assertTrue(conn.closed)
+
+    def test_reconnect(self):
+        conn = PipeConnection()
+        reconnected = threading.Event()
+        error = psycopg2.OperationalError("could not connect")
+        listener, received, done, connect = self.listener([error, conn], on_reconnect = reconnected.set)
+        with self.assertLogs("sedezcompendium.common.SQLNotify", "ERROR"):
+            listener.start()
+            self.assertTrue(reconnected.wait(1))
+        conn.send("sedez", "payload")
+        self.assertTrue(done.wait(1))
+        self.assertEqual(connect.call_count, 2)
+
+    def test_channel_name(self):
+        with self.assertRaises(ValueError):
+            SQLNotify.NotifyListener("sedez; DROP TABLE users", print)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import sys
+sys.path.append("C:\\Dev\\SedezCompendium")
+
+import datetime
+import decimal
+import os
+import pickle
+import tempfile
+import uuid
+import unittest
+from unittest import mock
+import sedezcompendium.common.SQLObjects as SQLObjects
+import sedezcompendium.common.SQLSnapshot as SQLSnapshot
+
+
+class UserRow(SQLObjects.Row):
+    TABLE_NAME = "users"
+    __columns__ = ("id", "name", "updated")
+
+
+class UserTable(SQLObjects.Table):
+    ROW_TYPE = UserRow
+
+
+class UserColumns(SQLObjects.ColumnTable):
+    ROW_TYPE = UserRow
+
+
+class OtherTable(SQLObjects.Table):
+    TABLE_NAME = "others"
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "users.snapshot")
+        self.table = UserTable(*(UserRow(i, f"user{i}", i * 10) for i in range(5)))
+
+    def test_round_trip(self):
+        header = self.table.dump(self.path, "updated")
+        self.assertEqual((header["table"], header["rows"], header["watermark"]), ("users", 5, 40))
+        table = UserTable.load(self.path)
+        self.assertIsInstance(table, UserTable)
+        self.assertEqual(table, self.table)
+        self.assertEqual(SQLSnapshot.read_header(self.path)["columns"], UserRow.__columns__)
+
+    def test_lazy_rows(self):
+        self.table.dump(self.path)
+        table = UserTable.load(self.path)
+        self.assertEqual(len(table), 5)
+        self.assertEqual(sum(row is None for row in table.__rows__._decoded), 5)
+        self.assertEqual(table.__rows__[-1], UserRow(4, "user4", 40))
+        self.assertEqual(sum(row is None for row in table.__rows__._decoded), 4)
+        self.assertEqual(table.__rows__[3].dirty_columns(), ())
+
+    def test_change_rows(self):
+        self.table.dump(self.path)
+        table = UserTable.load(self.path)
+        table.add_row(UserRow(5, "user5", 50))
+        table.remove_row(UserRow(0, "user0", 0))
+        self.assertEqual([row.id for row in table], [1, 2, 3, 4, 5])
+
+    def test_column_table(self):
+        self.table.dump(self.path)
+        table = UserColumns.load(self.path)
+        self.assertEqual(table.sum("updated"), 100)
+
+    def test_wrong_table(self):
+        self.table.dump(self.path)
+        with self.assertRaises(ValueError):
+            OtherTable.load(self.path)
+        with open(self.path, "wb") as file:
+            file.write(b"SEDZ")
+        with self.assertRaises(ValueError):
+            UserTable.load(self.path)
+
+    def test_value_types(self):
+        updated = datetime.datetime(2024, 1, 2, tzinfo = datetime.timezone.utc)
+        table = UserTable(UserRow(uuid.UUID(int = 1), decimal.Decimal("1.5"), updated))
+        table.dump(self.path)
+        self.assertEqual(UserTable.load(self.path), table)
+
+    def test_code_is_not_run(self):
+        last = (4, "x" * 50, 40)
+        UserTable(*self.table.__rows__[:4], UserRow(*last)).dump(self.path)
+        with open(self.path, "rb") as file:
+            data = file.read()
+        # the last row, swapped for one that's rebuilt by calling os.system
+        blob = pickle.dumps(last, pickle.HIGHEST_PROTOCOL)
+        malicious = b"cos\nsystem\n(S'echo pwned'\ntR.".ljust(len(blob), b"\0")
+        with open(self.path, "wb") as file:
+            file.write(data.replace(blob, malicious))
+        table = UserTable.load(self.path)
+        with mock.patch("os.system") as system, self.assertRaises(ValueError):
+            table.__rows__[4]
+        system.assert_not_called()
+        self.assertEqual(table.__rows__[3], UserRow(3, "user3", 30))
+
+    def test_corrupt_file(self):
+        self.table.dump(self.path)
+        with open(self.path, "rb") as file:
+            data = file.read()
+        with open(self.path, "wb") as file:
+            file.write(data[:-3])
+        with self.assertRaises(ValueError):
+            UserTable.load(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import sys
 sys.path.append("C:\\Dev\\SedezCompendium")
 
 import unittest
+from unittest import mock
 import sedezcompendium.common.SQLObjects as SQLObjects
 
 
@@ -71,5 +72,296 @@ class TestRowMethods(unittest.TestCase):
         self.assertIn(self.nRow(1), self.NTable(self.nRow(2), self.nRow(1)))
 
 
+
+class TestSlottedRows(unittest.TestCase):
+
+    class UserRow(SQLObjects.Row):
+        TABLE_NAME = "users"
+        __columns__ = ("id", "name")
+
+    def test_slotted(self):
+        row = self.UserRow(1, "sedez")
+        self.assertFalse(hasattr(row, "__dict__"))
+        self.assertEqual((row.id, row.name), (1, "sedez"))
+        row.name = "compendium"
+        self.assertEqual(row, self.UserRow(1, "compendium"))
+        self.assertEqual(list(row), ["id", "name"])
+        with self.assertRaises(AttributeError):
+            row.other = 1
+        with self.assertRaises(IndexError):
+            self.UserRow(1)
+
+    def test_subclass(self):
+        class AdminRow(self.UserRow):
+            __columns__ = ("id", "name", "level")
+
+        row = AdminRow(1, "sedez", 3)
+        self.assertFalse(hasattr(row, "__dict__"))
+        self.assertEqual(row.level, 3)
+
+        class UpperRow(self.UserRow):
+            def __init__(self, *row):
+                super().__init__(row[0], row[1].upper())
+
+        class ChildRow(UpperRow):
+            pass
+
+        class GrandchildRow(ChildRow):
+            __columns__ = ("id", "name")
+
+        for row_type in (UpperRow, ChildRow, GrandchildRow):
+            self.assertEqual(row_type(1, "sedez").name, "SEDEZ")
+            self.assertEqual(SQLObjects.row_factory(row_type)((1, "sedez")).name, "SEDEZ")
+
+    def test_unslottable_columns(self):
+        class DefaultRow(SQLObjects.Row):
+            __columns__ = ("id", "name")
+            name = None
+
+        class NumberedRow(SQLObjects.Row):
+            __columns__ = ("1", "2")
+
+        self.assertEqual(DefaultRow(1, "sedez").name, "sedez")
+        self.assertEqual(getattr(NumberedRow(1, 2), "2"), 2)
+
+    def test_remove_column(self):
+        class ScoreRow(SQLObjects.Row):
+            __columns__ = ("id", "score", "name")
+
+        ScoreRow.remove_column("score")
+        row = ScoreRow(1, "sedez")
+        self.assertEqual((row.id, row.name), (1, "sedez"))
+
+
+
+class TestRowFactory(unittest.TestCase):
+
+    class UserRow(SQLObjects.Row):
+        TABLE_NAME = "users"
+        __columns__ = ("id", "name")
+
+    def test_compiled_once(self):
+        factory = SQLObjects.row_factory(self.UserRow)
+        self.assertIs(SQLObjects.row_factory(self.UserRow), factory)
+        row = factory((1, "sedez"))
+        self.assertEqual(row, self.UserRow(1, "sedez"))
+        self.assertEqual(row._loaded, (1, "sedez"))
+        self.assertEqual(row.dirty_columns(), ())
+
+    def test_nrow(self):
+        factory = SQLObjects.row_factory(SQLObjects.nRow, ["id", "count(*)"])
+        self.assertIs(SQLObjects.row_factory(SQLObjects.nRow, ("id", "count(*)")), factory)
+        row = factory((1, 5))
+        self.assertEqual(row, SQLObjects.nRow(1, 5, columns = ("id", "count(*)")))
+        self.assertEqual(getattr(row, "count(*)"), 5)
+
+    def test_own_init(self):
+        class LowerRow(self.UserRow):
+            def __init__(self, *row):
+                super().__init__(row[0], row[1].lower())
+
+        row = SQLObjects.row_factory(LowerRow)((1, "Sedez"))
+        self.assertEqual(row.name, "sedez")
+        self.assertEqual(row._loaded, (1, "Sedez"))
+
+    def test_columns_changed(self):
+        class ScratchRow(SQLObjects.Row):
+            __columns__ = ("id", "name", "level")
+
+        SQLObjects.row_factory(ScratchRow)
+        ScratchRow.remove_column("level")
+        row = SQLObjects.row_factory(ScratchRow)((1, "sedez"))
+        self.assertEqual(tuple(row.__columns__), ("id", "name"))
+
+
+class TestIndexes(unittest.TestCase):
+
+    class UserRow(SQLObjects.Row):
+        __columns__ = ("id", "name")
+
+    class UserTable(SQLObjects.Table):
+        pass
+
+    def table(self):
+        return self.UserTable(self.UserRow(1, "a"), self.UserRow(2, "b"), self.UserRow(3, "a"))
+
+    def test_lookup(self):
+        table = self.table()
+        table.create_index("id", unique = True)
+        table.create_index("name")
+        self.assertEqual(table.lookup("id", 2), self.UserRow(2, "b"))
+        self.assertIsNone(table.lookup("id", 9))
+        self.assertEqual([row.id for row in table.lookup("name", "a")], [1, 3])
+        self.assertEqual(table.lookup("name", "c"), [])
+
+    def test_lookup_without_index(self):
+        self.assertEqual([row.id for row in self.table().lookup("name", "a")], [1, 3])
+
+    def test_maintained(self):
+        table = self.table()
+        table.create_index("id", unique = True)
+        table.create_index("name")
+        table.add_row(self.UserRow(4, "a"))
+        table.remove_row(self.UserRow(1, "a"))
+        self.assertIsNone(table.lookup("id", 1))
+        self.assertEqual([row.id for row in table.lookup("name", "a")], [3, 4])
+        with self.assertRaises(ValueError):
+            table.add_row(self.UserRow(4, "d"))
+        self.assertEqual(len(table), 3)
+        with self.assertRaises(ValueError):
+            table.create_index("name", unique = True)
+
+    def test_contains(self):
+        table = self.table()
+        table.create_index("id", unique = True)
+        self.assertIn(self.UserRow(2, "b"), table)
+        self.assertNotIn(self.UserRow(2, "a"), table)
+        self.assertNotIn(self.UserRow(5, "a"), table)
+
+    def test_contains_hashable(self):
+        class HashRow(self.UserRow):
+            def __hash__(self):
+                return hash((self.id, self.name))
+
+        table = self.UserTable(HashRow(1, "a"), HashRow(2, "b"))
+        self.assertIn(HashRow(2, "b"), table)
+        table.add_row(HashRow(3, "c"))
+        table.remove_row(HashRow(1, "a"))
+        self.assertIn(HashRow(3, "c"), table)
+        self.assertNotIn(HashRow(1, "a"), table)
+
+    def test_reindex(self):
+        table = self.table()
+        table.create_index("name")
+        table.lookup("name", "b")[0].name = "c"
+        table.reindex()
+        self.assertEqual([row.id for row in table.lookup("name", "c")], [2])
+
+
+
+class TestDiff(unittest.TestCase):
+
+    class UserRow(SQLObjects.Row):
+        __columns__ = ("id", "name")
+
+    class UserTable(SQLObjects.Table):
+        pass
+
+    def test_diff(self):
+        before = self.UserTable(self.UserRow(1, "a"), self.UserRow(2, "b"), self.UserRow(3, "c"))
+        after = self.UserTable(self.UserRow(3, "c"), self.UserRow(2, "x"), self.UserRow(4, "d"))
+        changes = after.diff(before)
+        self.assertEqual(changes.inserted, [self.UserRow(4, "d")])
+        self.assertEqual(changes.updated, [self.UserRow(2, "x")])
+        self.assertEqual(changes.deleted, [self.UserRow(1, "a")])
+        self.assertEqual(after.diff(after), ([], [], []))
+
+    def test_composite_key(self):
+        before = self.UserTable(self.UserRow(1, "a"))
+        after = self.UserTable(self.UserRow(1, "b"))
+        self.assertEqual(after.diff(before, ("id", "name")), ([self.UserRow(1, "b")], [], [self.UserRow(1, "a")]))
+        self.assertEqual(after.diff(before, "id").updated, [self.UserRow(1, "b")])
+
+    def test_repeated_key(self):
+        table = self.UserTable(self.UserRow(1, "a"), self.UserRow(1, "b"))
+        with self.assertRaises(ValueError):
+            table.diff(self.UserTable())
+        with self.assertRaises(ValueError):
+            self.UserTable().diff(table)
+
+
+
+class ScoreRow(SQLObjects.Row):
+    TABLE_NAME = "scores"
+    __columns__ = ("id", "name", "score")
+
+
+class ScoreColumns(SQLObjects.ColumnTable):
+    ROW_TYPE = ScoreRow
+
+
+class TestColumnTable(unittest.TestCase):
+
+    def table(self):
+        return ScoreColumns(ScoreRow(1, "a", 3.0), ScoreRow(2, "b", 1.0), ScoreRow(3, "a", 2.0), ScoreRow(4, None, 1.0))
+
+    def test_rows(self):
+        table = self.table()
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table[1], ScoreRow(2, "b", 1.0))
+        self.assertIsInstance(table[0].id, int)
+        self.assertEqual(list(table)[2], ScoreRow(3, "a", 2.0))
+        self.assertIn(ScoreRow(4, None, 1.0), table)
+        self.assertNotIn(ScoreRow(4, "b", 1.0), table)
+
+    def test_filter(self):
+        table = self.table()
+        self.assertEqual([row.id for row in table.filter(name = "a")], [1, 3])
+        self.assertEqual([row.id for row in table.filter(table.mask("score", "<", 2.5))], [2, 3, 4])
+        self.assertEqual([row.id for row in table.filter(table.mask("score", "<", 2.5), name = "a")], [3])
+        self.assertEqual([row.id for row in table.filter(table.mask("id", "in", (1, 4)))], [1, 4])
+        self.assertEqual([row.id for row in table.filter(name = None)], [4])
+        self.assertEqual([row.id for row in table.filter(table.mask("id", lambda v: v % 2 == 0))], [2, 4])
+
+    def test_sort_by(self):
+        table = self.table()
+        self.assertEqual([row.id for row in table.sort_by("score")], [2, 4, 3, 1])
+        self.assertEqual([row.id for row in table.sort_by("score", reverse = True)], [1, 3, 2, 4])
+
+    def test_aggregates(self):
+        table = self.table()
+        self.assertEqual(table.sum("score"), 7.0)
+        self.assertEqual(table.sum("score", name = "a"), 5.0)
+        self.assertEqual((table.min("id"), table.max("id")), (1, 4))
+        self.assertEqual(table.mean("score"), 1.75)
+        self.assertIsNone(table.mean("score", name = "c"))
+
+    def test_aggregates_skip_nulls(self):
+        table = ScoreColumns(ScoreRow(1, "a", 3), ScoreRow(2, "b", None), ScoreRow(3, "a", 1))
+        self.assertEqual(table.sum("score"), 4)
+        self.assertEqual((table.min("score"), table.max("score")), (1, 3))
+        self.assertEqual(table.mean("score"), 2.0)
+        self.assertEqual(table.sum("score", name = "b"), 0)
+        self.assertIsNone(table.mean("score", name = "b"))
+
+    def test_row_type(self):
+        class AnyColumns(SQLObjects.ColumnTable):
+            TABLE_NAME = "scores"
+
+        self.assertIs(AnyColumns.row_type(), SQLObjects.nRow)
+        self.assertIs(ScoreColumns.row_type(), ScoreRow)
+
+    def test_from_records(self):
+        table = ScoreColumns.from_records([(1, "a", 3.0), (2, "b", 1.0)])
+        self.assertEqual(table.sum("id"), 3)
+        self.assertEqual(len(ScoreColumns.from_records([])), 0)
+
+    def test_index(self):
+        table = self.table()
+        table.create_index("id", unique = True)
+        table.create_index("name")
+        self.assertEqual(table.lookup("id", 3), ScoreRow(3, "a", 2.0))
+        self.assertEqual([row.id for row in table.lookup("name", "a")], [1, 3])
+        table.remove_row(ScoreRow(1, "a", 3.0))
+        table.add_row(ScoreRow(5, "a", 4.0))
+        self.assertEqual([row.id for row in table.lookup("name", "a")], [3, 5])
+        self.assertIn(ScoreRow(5, "a", 4.0), table)
+        self.assertEqual(table.filter(name = "a").lookup("id", 2), [])
+
+    def test_add_remove_row(self):
+        table = self.table()
+        table.add_row(ScoreRow(5, "c", 4.0))
+        table.remove_row(ScoreRow(1, "a", 3.0))
+        self.assertEqual([row.id for row in table], [2, 3, 4, 5])
+
+
+class TestColumnTableFallback(TestColumnTable):
+
+    def setUp(self):
+        patch = mock.patch.object(SQLObjects, "numpy", None)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file